@@ -0,0 +1,205 @@
+import argparse
+import csv
+import itertools
+import math
+
+# Communication issue types (as stored in Communication_Issue_Type)
+ISSUE_NORMAL = 0
+ISSUE_LATENCY = 1
+ISSUE_PACKET_LOSS = 2
+ISSUE_THROUGHPUT = 3
+ISSUE_CONNECTION = 4
+ISSUE_RESOURCE = 5
+
+# Monitored metrics in priority order: (metric, issue type, direction, min std)
+# direction is 1 when high values are bad and -1 when low values are bad
+METRIC_ISSUES = [
+    ("packet_loss", ISSUE_PACKET_LOSS, 1, 1.0),
+    ("latency", ISSUE_LATENCY, 1, 5.0),
+    ("throughput", ISSUE_THROUGHPUT, -1, 100.0),
+    ("cpu_usage", ISSUE_RESOURCE, 1, 2.0),
+    ("memory_usage", ISSUE_RESOURCE, 1, 1.0),
+]
+
+# Dataset columns holding each metric
+METRIC_COLUMNS = {
+    "packet_loss": "Packet_Loss_Percent",
+    "latency": "Latency_ms",
+    "throughput": "Throughput_BytesPerSec",
+    "cpu_usage": "CPU_Utilization_Percent",
+    "memory_usage": "Memory_Usage_Percent",
+}
+
+
+class EWMADetector:
+    """Exponentially weighted mean/variance tracker scoring samples by z-score"""
+
+    def __init__(self, alpha=0.1, threshold=3.0, warmup=20, direction=1,
+                 min_std=1.0, min_rel_std=0.05):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.direction = direction
+        self.min_std = min_std
+        self.min_rel_std = min_rel_std
+        self.mean = 0.0
+        self.var = 0.0
+        self.count = 0
+
+    @property
+    def ready(self):
+        return self.count > self.warmup
+
+    def _std(self):
+        return max(math.sqrt(self.var), abs(self.mean) * self.min_rel_std, self.min_std)
+
+    def _zscore(self, value):
+        return self.direction * (value - self.mean) / self._std()
+
+    def _observe(self, value):
+        if self.count == 0:
+            self.mean = value
+        else:
+            deviation = value - self.mean
+            increment = self.alpha * deviation
+            self.mean += increment
+            self.var = (1 - self.alpha) * (self.var + deviation * increment)
+        self.count += 1
+
+    def update(self, value):
+        """Add a sample and return its anomaly score (>= 1.0 is anomalous)"""
+        score = max(0.0, self._zscore(value) / self.threshold) if self.ready else 0.0
+        if score >= 1.0:
+            # Clip outliers so a single spike doesn't drag the baseline along
+            limit = self.threshold * self._std()
+            value = min(max(value, self.mean - limit), self.mean + limit)
+        self._observe(value)
+        return score
+
+
+class CUSUMDetector(EWMADetector):
+    """One-sided CUSUM change-point detector over standardized samples"""
+
+    def __init__(self, alpha=0.02, threshold=5.0, warmup=20, direction=1,
+                 min_std=1.0, min_rel_std=0.05, drift=0.5):
+        super().__init__(alpha, threshold, warmup, direction, min_std, min_rel_std)
+        self.drift = drift
+        self.cusum = 0.0
+
+    def update(self, value):
+        """Add a sample and return the change-point score (>= 1.0 is a change)"""
+        score = 0.0
+        if self.ready:
+            # Cap the sum so a long-lasting shift recovers quickly once it ends
+            self.cusum = min(
+                2 * self.threshold,
+                max(0.0, self.cusum + self._zscore(value) - self.drift),
+            )
+            score = self.cusum / self.threshold
+        self._observe(value)
+        return score
+
+
+DETECTORS = {
+    "ewma": EWMADetector,
+    "cusum": CUSUMDetector,
+}
+
+
+def score_confidence(score):
+    """Map a detector score to a confidence in [0.5, 1] for the chosen class"""
+    if score >= 1.0:
+        return 1 - 0.5 / score
+    return 1 - 0.5 * score
+
+
+class IssueClassifier:
+    """Streaming issue classifier built from pluggable detectors
+
+    Detector state is kept by the caller (one per topic), see create_state().
+    """
+
+    def __init__(self, detector="ewma", **params):
+        self.factory = DETECTORS[detector] if isinstance(detector, str) else detector
+        self.params = params
+
+    def create_state(self):
+        """Create a fresh set of metric detectors for one topic"""
+        return {
+            metric: self.factory(direction=direction, min_std=min_std, **self.params)
+            for metric, _, direction, min_std in METRIC_ISSUES
+        }
+
+    def classify(self, state, metrics):
+        """Update a topic's detector state and return (issue_type, confidence)"""
+        if metrics["mqtt_connection_state"] != "Connected":
+            return ISSUE_CONNECTION, 1.0
+
+        scores = {metric: state[metric].update(metrics[metric]) for metric in state}
+        for metric, issue_type, _, _ in METRIC_ISSUES:
+            if scores[metric] >= 1.0:
+                return issue_type, score_confidence(scores[metric])
+
+        # Confidence in "normal" grows as the detectors warm up
+        detector = state["latency"]
+        warmed = min(1.0, detector.count / (detector.warmup + 1))
+        return ISSUE_NORMAL, score_confidence(max(scores.values())) * warmed
+
+
+def row_metrics(row):
+    """Extract classifier metrics from a stored dataset row"""
+    metrics = {metric: float(row[column] or 0)
+               for metric, column in METRIC_COLUMNS.items()}
+    metrics["mqtt_connection_state"] = row.get("MQTT_Connection_State", "Connected")
+    return metrics
+
+
+def classify_rows(rows, classifier=None):
+    """Run the streaming classifier over stored dataset rows, in order"""
+    if classifier is None:
+        classifier = IssueClassifier()
+
+    states = {}
+    for row in rows:
+        state = states.get(row["Topic"])
+        if state is None:
+            state = states[row["Topic"]] = classifier.create_state()
+        yield classifier.classify(state, row_metrics(row))
+
+
+def classify_csv(input_path, output_path, detector="ewma"):
+    """Re-label a stored dataset with the streaming classifier"""
+    with open(input_path, "r", newline="") as infile:
+        reader = csv.DictReader(infile)
+        headers = list(reader.fieldnames)
+        if "Issue_Confidence" not in headers:
+            headers.insert(headers.index("Communication_Issue_Type") + 1,
+                           "Issue_Confidence")
+
+        with open(output_path, "w", newline="") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=headers)
+            writer.writeheader()
+
+            # tee keeps at most one row buffered since both sides advance together
+            rows, labelled = itertools.tee(reader)
+            results = classify_rows(labelled, IssueClassifier(detector))
+            for row, (issue_type, confidence) in zip(rows, results):
+                row["Communication_Issue_Type"] = issue_type
+                row["Issue_Confidence"] = round(confidence, 4)
+                writer.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Classify communication issues in a stored dataset")
+    parser.add_argument("input", help="dataset CSV to classify")
+    parser.add_argument("output", help="where to write the labelled CSV")
+    parser.add_argument("--detector", choices=sorted(DETECTORS), default="ewma")
+    args = parser.parse_args()
+
+    classify_csv(args.input, args.output, args.detector)
+    print(f"Wrote labelled dataset: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from array import array
+
+# Imported by Segment: only needed for reading segments, and slow to import
+numpy = None
+
+# A segment is a directory with one append-only file per column and a small
+# JSON header. Only the first "rows" values of each column file are valid;
+# the header is replaced atomically after the column files are appended to,
+# so readers always see a consistent row count.
+HEADER_FILE = "segment.json"
+VERSION = 1
+
+# Column encodings: (array typecode, numpy dtype)
+ENCODINGS = {
+    "REAL": ("d", "f8"),
+    "INTEGER": ("q", "i8"),
+    "DICT": ("I", "u4"),
+    "STRING": ("q", "i8"),  # end offsets into the .bytes file
+}
+
+# Stored for missing integers; missing reals are NaN
+INT_NULL = -(2 ** 63)
+
+# High-cardinality text columns stored as raw strings instead of dictionaries
+STRING_COLUMNS = {"Message_ID", "Received_Payload", "Time_of_Day"}
+
+
+def column_encoding(name, column_type):
+    if column_type == "TEXT":
+        return "STRING" if name in STRING_COLUMNS else "DICT"
+    return column_type if column_type in ("REAL", "INTEGER") else "REAL"
+
+
+def read_header(directory):
+    """Return the header of the segment in directory, or None if there is none"""
+    header_path = os.path.join(directory, HEADER_FILE)
+    if not os.path.exists(header_path):
+        return None
+    with open(header_path, "r") as f:
+        return json.load(f)
+
+
+def to_real(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def to_integer(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return INT_NULL
+
+
+class SegmentWriter:
+    """Appends rows to a columnar segment directory"""
+
+    def __init__(self, directory, headers, column_types=None):
+        self.directory = directory
+        column_types = column_types or {}
+        os.makedirs(directory, exist_ok=True)
+
+        self.header = read_header(directory)
+        if self.header:
+            if [c["name"] for c in self.header["columns"]] != list(headers):
+                raise ValueError(f"Segment {directory} has different columns")
+            if self.header["byteorder"] != sys.byteorder:
+                raise ValueError(f"Segment {directory} was written with another byte order")
+            self._truncate_to_header()
+        else:
+            self.header = {
+                "version": VERSION,
+                "byteorder": sys.byteorder,
+                "rows": 0,
+                "columns": [
+                    {
+                        "name": name,
+                        "encoding": column_encoding(name, column_types.get(name, "TEXT")),
+                        "file": f"{index:03d}_{name}.col",
+                    }
+                    for index, name in enumerate(headers)
+                ],
+            }
+
+        self.dictionaries = {}
+        self.codes = {}
+        # Dictionary sizes last written, so unchanged ones aren't rewritten
+        self.written = {}
+        self.string_offsets = {}
+        for column in self.header["columns"]:
+            if column["encoding"] == "DICT":
+                values = self._load_dictionary(column)
+                self.dictionaries[column["name"]] = values
+                self.written[column["name"]] = len(values)
+                self.codes[column["name"]] = {value: code for code, value in enumerate(values)}
+            elif column["encoding"] == "STRING":
+                path = self._path(column["file"] + ".bytes")
+                self.string_offsets[column["name"]] = (
+                    os.path.getsize(path) if os.path.exists(path) else 0)
+
+        self.pending = [array(ENCODINGS[c["encoding"]][0]) for c in self.header["columns"]]
+        self.pending_bytes = {name: bytearray() for name in self.string_offsets}
+        self.pending_rows = 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load_dictionary(self, column):
+        path = self._path(column["file"] + ".dict")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _truncate_to_header(self):
+        """Drop values appended after the last header update (e.g. after a crash)"""
+        rows = self.header["rows"]
+        for column in self.header["columns"]:
+            typecode = ENCODINGS[column["encoding"]][0]
+            path = self._path(column["file"])
+            if not os.path.exists(path):
+                continue
+            with open(path, "r+b") as f:
+                f.truncate(rows * array(typecode).itemsize)
+            if column["encoding"] == "STRING" and os.path.exists(path + ".bytes"):
+                end = 0
+                if rows:
+                    with open(path, "rb") as f:
+                        f.seek((rows - 1) * 8)
+                        end = array("q", f.read(8))[0]
+                with open(path + ".bytes", "r+b") as f:
+                    f.truncate(end)
+
+    def __len__(self):
+        return self.header["rows"] + self.pending_rows
+
+    def append(self, row):
+        for column, values, value in zip(self.header["columns"], self.pending, row):
+            encoding = column["encoding"]
+            if encoding == "REAL":
+                values.append(to_real(value))
+            elif encoding == "INTEGER":
+                values.append(to_integer(value))
+            elif encoding == "DICT":
+                name = column["name"]
+                value = "" if value is None else str(value)
+                code = self.codes[name].get(value)
+                if code is None:
+                    code = self.codes[name][value] = len(self.dictionaries[name])
+                    self.dictionaries[name].append(value)
+                values.append(code)
+            else:
+                name = column["name"]
+                data = ("" if value is None else str(value)).encode()
+                self.pending_bytes[name] += data
+                self.string_offsets[name] += len(data)
+                values.append(self.string_offsets[name])
+        self.pending_rows += 1
+
+    def flush(self):
+        """Append pending rows to the column files, then publish the new row count"""
+        if not self.pending_rows:
+            return
+
+        for column, values in zip(self.header["columns"], self.pending):
+            with open(self._path(column["file"]), "ab") as f:
+                values.tofile(f)
+            del values[:]
+
+            name = column["name"]
+            if column["encoding"] == "STRING":
+                with open(self._path(column["file"] + ".bytes"), "ab") as f:
+                    f.write(self.pending_bytes[name])
+                self.pending_bytes[name] = bytearray()
+            elif (column["encoding"] == "DICT"
+                    and len(self.dictionaries[name]) != self.written[name]):
+                self._replace(column["file"] + ".dict", self.dictionaries[name])
+                self.written[name] = len(self.dictionaries[name])
+
+        self.header["rows"] += self.pending_rows
+        self.pending_rows = 0
+        self._replace(HEADER_FILE, self.header)
+
+    def _replace(self, name, data):
+        path = self._path(name)
+        with open(path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def close(self):
+        self.flush()
+
+
+class Segment:
+    """Reads a columnar segment with numpy.memmap (zero-copy column projection)"""
+
+    def __init__(self, directory):
+        global numpy
+        if numpy is None:
+            try:
+                import numpy
+            except ImportError:
+                raise ImportError("Reading columnar segments requires numpy") from None
+
+        self.directory = directory
+        with open(os.path.join(directory, HEADER_FILE), "r") as f:
+            self.header = json.load(f)
+        self.rows = self.header["rows"]
+        self.byteorder = "<" if self.header["byteorder"] == "little" else ">"
+        self.columns = {column["name"]: column for column in self.header["columns"]}
+
+    def _memmap(self, column):
+        if self.rows == 0:
+            return numpy.empty(0, dtype=ENCODINGS[column["encoding"]][1])
+        dtype = numpy.dtype(self.byteorder + ENCODINGS[column["encoding"]][1])
+        return numpy.memmap(os.path.join(self.directory, column["file"]),
+                            dtype=dtype, mode="r", shape=(self.rows,))
+
+    def column(self, name):
+        """Raw column values: numbers, dictionary codes or string end offsets"""
+        return self._memmap(self.columns[name])
+
+    def project(self, names):
+        """Return {name: column} for the requested columns only"""
+        return {name: self.column(name) for name in names}
+
+    def dictionary(self, name):
+        """Values of a dictionary-encoded column, indexed by code"""
+        column = self.columns[name]
+        with open(os.path.join(self.directory, column["file"] + ".dict"), "r") as f:
+            return json.load(f)
+
+    def decode(self, name):
+        """Materialize a text column as a numpy array of strings"""
+        column = self.columns[name]
+        if column["encoding"] == "DICT":
+            return numpy.array(self.dictionary(name), dtype=object)[self.column(name)]
+        if column["encoding"] == "STRING":
+            ends = self.column(name)
+            with open(os.path.join(self.directory, column["file"] + ".bytes"), "rb") as f:
+                data = f.read()
+            starts = numpy.concatenate(([0], ends[:-1]))
+            return numpy.array(
+                [data[start:end].decode() for start, end in zip(starts, ends)], dtype=object)
+        return numpy.asarray(self.column(name))
+
+
+def csv_to_segment(csv_path, directory, column_types=None, batch_size=10000):
+    """Convert an existing dataset CSV into a columnar segment"""
+    with open(csv_path, "r", newline="") as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        writer = SegmentWriter(directory, headers, column_types)
+        for row in reader:
+            writer.append(row)
+            if writer.pending_rows >= batch_size:
+                writer.flush()
+        writer.close()
+    return len(writer)
+
+
+def main():
+    # Imported here as the subscriber's storage imports this module
+    from subscriber import csv_column_types
+
+    parser = argparse.ArgumentParser(description="Convert a dataset CSV into a columnar segment")
+    parser.add_argument("input", help="dataset CSV")
+    parser.add_argument("output", help="segment directory to create or append to")
+    args = parser.parse_args()
+
+    rows = csv_to_segment(args.input, args.output, csv_column_types)
+    print(f"Wrote {rows} rows to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import functools
+import time
+from collections import OrderedDict, deque
+
+# Rough in-memory cost of the state kept for one device and one topic
+# (histories, counters and anomaly detectors), used for the memory budget
+DEVICE_STATE_BYTES = 1024
+TOPIC_STATE_BYTES = 4096
+
+DEFAULT_DEVICE = "default"
+
+# Packet loss is measured over the most recent sequence numbers of a device
+LOSS_WINDOW = 100
+
+
+@functools.lru_cache(maxsize=4096)
+def resolve_topic(topic):
+    """Map a topic to (device, sensor)
+
+    Topics look like ``sensor/<device>/<sensor>/<reading>``. Older firmware
+    published ``sensor/<sensor>/<reading>`` without a device segment; those
+    are attributed to the default device.
+    """
+    parts = topic.split("/")
+    if len(parts) >= 4:
+        return parts[1], "/".join(parts[2:])
+    if len(parts) == 3:
+        return DEFAULT_DEVICE, "/".join(parts[1:])
+    return DEFAULT_DEVICE, topic
+
+
+class TopicState:
+    """Rolling statistics kept for one topic of a device"""
+
+    __slots__ = (
+        "latency_history",
+        "value_history",
+        "message_count",
+        "messages_per_minute",
+        "failed_deliveries",
+        "duplicates",
+        "detectors",
+    )
+
+    def __init__(self, history_size=20):
+        self.latency_history = deque(maxlen=history_size)
+        self.value_history = deque(maxlen=history_size)
+        self.message_count = 0
+        self.messages_per_minute = 0
+        self.failed_deliveries = 0
+        self.duplicates = 0
+        self.detectors = None
+
+    def add_value(self, value, held=0):
+        """Append a reported value after ``held`` repeats of the previous one"""
+        if held and self.value_history:
+            last_value = self.value_history[-1]
+            self.value_history.extend(
+                [last_value] * min(held, self.value_history.maxlen))
+        self.value_history.append(value)
+
+
+class DeviceState:
+    """Per-device state, created on the device's first message"""
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.topics = {}
+        self.last_seen = 0
+        self.boot_id = None
+        self.last_sequence = 0
+        self.received = 0
+        self.lost = 0
+        # Recent sequence numbers, oldest first: True if missing, False if
+        # received. The last ``boot_span`` entries are consecutive sequence
+        # numbers of the current boot, ending at last_sequence.
+        self.window = deque(maxlen=LOSS_WINDOW)
+        self.window_lost = 0
+        self.boot_span = 0
+
+    def _push(self, missing):
+        if len(self.window) == self.window.maxlen and self.window[0]:
+            self.window_lost -= 1
+        self.window.append(missing)
+        self.window_lost += missing
+        self.boot_span += 1
+
+    def track_sequence(self, message_id):
+        """Account for gaps in the <device>-<boot>-<sequence> message IDs"""
+        try:
+            _, boot_id, sequence = message_id.split("-")
+            sequence = int(sequence)
+        except ValueError:
+            return
+
+        if boot_id != self.boot_id:
+            # Device restarted, sequence numbers start over
+            self.boot_id = boot_id
+            self.boot_span = 0
+        elif sequence > self.last_sequence:
+            gap = sequence - self.last_sequence - 1
+            self.lost += gap
+            for _ in range(min(gap, LOSS_WINDOW)):
+                self._push(True)
+        else:
+            # Late arrival of a message counted as lost, if its sequence number
+            # is still in the window and marked missing. Anything else is a
+            # redelivery of a message already received and is ignored.
+            offset = self.last_sequence - sequence
+            index = len(self.window) - 1 - offset
+            if offset < min(len(self.window), self.boot_span) and self.window[index]:
+                self.window[index] = False
+                self.window_lost -= 1
+                self.lost = max(0, self.lost - 1)
+                self.received += 1
+            return
+
+        self.last_sequence = sequence
+        self.received += 1
+        self._push(False)
+
+    @property
+    def packet_loss(self):
+        """Percentage of the last LOSS_WINDOW sequence numbers that are missing"""
+        return self.window_lost * 100 / len(self.window) if self.window else 0
+
+    @property
+    def estimated_bytes(self):
+        return DEVICE_STATE_BYTES + TOPIC_STATE_BYTES * len(self.topics)
+
+
+class DeviceRegistry:
+    """Lazily created per-device state with idle and memory-budget eviction"""
+
+    def __init__(self, memory_budget=64 * 1024 * 1024, idle_timeout=3600,
+                 sweep_interval=60, on_evict=None):
+        self.memory_budget = memory_budget
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.on_evict = on_evict
+        self.devices = OrderedDict()
+        self.estimated_bytes = 0
+        self.evictions = 0
+        self.last_sweep = 0
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, topic, now=None):
+        """Return (device_state, topic_state) for a topic, creating them if needed"""
+        if now is None:
+            now = time.time()
+
+        device_id, sensor = resolve_topic(topic)
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = DeviceState(device_id)
+            self.estimated_bytes += DEVICE_STATE_BYTES
+        else:
+            self.devices.move_to_end(device_id)
+        device.last_seen = now
+
+        state = device.topics.get(sensor)
+        if state is None:
+            state = device.topics[sensor] = TopicState()
+            self.estimated_bytes += TOPIC_STATE_BYTES
+            self.evict(now)
+        elif now - self.last_sweep >= self.sweep_interval:
+            self.evict(now)
+        return device, state
+
+    def evict(self, now=None):
+        """Drop idle devices, then least recently seen ones while over budget"""
+        if now is None:
+            now = time.time()
+
+        self.last_sweep = now
+        cutoff = now - self.idle_timeout
+        while len(self.devices) > 1:
+            device = next(iter(self.devices.values()))
+            if device.last_seen >= cutoff and self.estimated_bytes <= self.memory_budget:
+                break
+            self._remove(device)
+
+    def _remove(self, device):
+        del self.devices[device.device_id]
+        self.estimated_bytes -= device.estimated_bytes
+        self.evictions += 1
+        if self.on_evict:
+            self.on_evict(device)
@@ -0,0 +1,219 @@
+import argparse
+import json
+import mmap
+import struct
+import time
+
+# Region layout (little endian, no padding):
+#   header | network block | slot 0 | slot 1 | ...
+# Every block starts with a seqlock counter: the writer makes it odd before
+# updating the block and even again afterwards. Readers retry until they see
+# the same even counter before and after copying a block.
+MAGIC = b"CSLS"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHII")  # magic, version, slot count, slot size, network size
+NETWORK = struct.Struct("<Qddqqddd")
+NETWORK_FIELDS = (
+    "rtt_ms",
+    "throughput",
+    "retransmissions",
+    "interface_errors",
+    "link_speed",
+    "buffer_status",
+    "updated",
+)
+SLOT = struct.Struct("<Q96sddddddddidQQd")
+SLOT_FIELDS = (
+    "topic",
+    "updated",
+    "last_value",
+    "latency_ms",
+    "latency_mean_ms",
+    "latency_min_ms",
+    "latency_max_ms",
+    "jitter_ms",
+    "rate_per_sec",
+    "issue_type",
+    "issue_confidence",
+    "message_count",
+    "duplicates",
+    "packet_loss",
+)
+SEQ = struct.Struct("<Q")
+
+
+def region_size(slots):
+    return HEADER.size + NETWORK.size + slots * SLOT.size
+
+
+class LiveStateWriter:
+    """Publishes the latest per-topic aggregates into a memory-mapped file"""
+
+    def __init__(self, path, slots=256, rate_alpha=0.2):
+        self.slots = slots
+        self.rate_alpha = rate_alpha
+        self.topics = {}
+        self.last_update = {}
+        self.rates = {}
+
+        with open(path, "wb") as f:
+            f.truncate(region_size(slots))
+        self.file = open(path, "r+b")
+        self.region = mmap.mmap(self.file.fileno(), region_size(slots))
+        HEADER.pack_into(self.region, 0, MAGIC, VERSION, slots, SLOT.size, NETWORK.size)
+
+    def close(self):
+        self.region.close()
+        self.file.close()
+
+    def _write(self, offset, block, values):
+        seq = SEQ.unpack_from(self.region, offset)[0]
+        SEQ.pack_into(self.region, offset, seq + 1)
+        block.pack_into(self.region, offset, seq + 1, *values)
+        SEQ.pack_into(self.region, offset, seq + 2)
+
+    def _slot(self, topic, now):
+        slot = self.topics.get(topic)
+        if slot is None:
+            if len(self.topics) < self.slots:
+                slot = len(self.topics)
+            else:
+                # Reuse the slot of the topic updated longest ago
+                stale = min(self.topics, key=self.last_update.get)
+                slot = self.topics.pop(stale)
+                self.last_update.pop(stale)
+                self.rates.pop(stale, None)
+            self.topics[topic] = slot
+        return slot
+
+    def update_topic(self, topic, value, latencies, jitter, issue_type,
+                     issue_confidence, message_count, duplicates, packet_loss,
+                     now=None):
+        """Write the latest aggregates of a topic"""
+        if now is None:
+            now = time.time()
+
+        slot = self._slot(topic, now)
+        previous = self.last_update.get(topic)
+        if previous is not None and now > previous:
+            instant = 1 / (now - previous)
+            rate = self.rates.get(topic, instant)
+            self.rates[topic] = rate + self.rate_alpha * (instant - rate)
+        self.last_update[topic] = now
+
+        latencies = latencies or [0]
+        self._write(
+            HEADER.size + NETWORK.size + slot * SLOT.size,
+            SLOT,
+            (
+                topic.encode()[:96],
+                now,
+                value,
+                latencies[-1],
+                sum(latencies) / len(latencies),
+                min(latencies),
+                max(latencies),
+                jitter,
+                self.rates.get(topic, 0),
+                issue_type,
+                issue_confidence,
+                message_count,
+                duplicates,
+                packet_loss,
+            ),
+        )
+
+    def update_network(self, network_stats, now=None):
+        """Write the latest network statistics"""
+        if now is None:
+            now = time.time()
+
+        rtt_history = network_stats["rtt_history"] or [0]
+        self._write(
+            HEADER.size,
+            NETWORK,
+            (
+                sum(rtt_history) / len(rtt_history),
+                network_stats["throughput"],
+                network_stats["retransmissions"],
+                network_stats["interface_errors"],
+                network_stats["link_speed"],
+                network_stats["buffer_status"],
+                now,
+            ),
+        )
+
+
+class LiveStateReader:
+    """Reads consistent snapshots of a live state region"""
+
+    def __init__(self, path, timeout=1.0):
+        self.timeout = timeout
+        self.file = open(path, "rb")
+        self.region = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.slots, slot_size, network_size = HEADER.unpack_from(
+            self.region, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a live state region: {path}")
+        if slot_size != SLOT.size or network_size != NETWORK.size:
+            raise ValueError(f"Unsupported live state layout: {path}")
+
+    def close(self):
+        self.region.close()
+        self.file.close()
+
+    def _read(self, offset, block):
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            before = SEQ.unpack_from(self.region, offset)[0]
+            if before % 2 == 0:
+                values = block.unpack_from(self.region, offset)
+                if SEQ.unpack_from(self.region, offset)[0] == before:
+                    return before, values[1:]
+            # Writer is mid-update, let it finish
+            time.sleep(0)
+        raise TimeoutError("Live state block kept changing while reading")
+
+    def network(self):
+        """Return the latest network statistics, or None if never written"""
+        seq, values = self._read(HEADER.size, NETWORK)
+        if seq == 0:
+            return None
+        return dict(zip(NETWORK_FIELDS, values))
+
+    def topics(self):
+        """Return {topic: aggregates} for every written slot"""
+        result = {}
+        for slot in range(self.slots):
+            seq, values = self._read(HEADER.size + NETWORK.size + slot * SLOT.size, SLOT)
+            if seq == 0:
+                continue
+            stats = dict(zip(SLOT_FIELDS, values))
+            topic = stats.pop("topic").rstrip(b"\0").decode()
+            result[topic] = stats
+        return result
+
+    def snapshot(self):
+        return {"network": self.network(), "topics": self.topics()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print live subscriber statistics")
+    parser.add_argument("path", help="live state file written by the subscriber")
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    reader = LiveStateReader(args.path)
+    try:
+        while True:
+            print(json.dumps(reader.snapshot(), indent=2))
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
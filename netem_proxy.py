@@ -0,0 +1,223 @@
+import argparse
+import heapq
+import json
+import random
+import socket
+import threading
+import time
+
+# Extra delay applied to a chunk that "loses" a packet. TCP never drops
+# bytes from the stream; a lost segment shows up as a retransmission delay.
+RETRANSMIT_DELAY_MS = 200
+
+BASELINE = {"name": "baseline"}
+
+
+def load_timeline(path):
+    """Load a timeline: {"repeat": bool, "conditions": [{"name", "duration", ...}]}"""
+    with open(path, "r") as f:
+        timeline = json.load(f)
+
+    for condition in timeline["conditions"]:
+        if "name" not in condition or "duration" not in condition:
+            raise ValueError(f"Condition needs a name and duration: {condition}")
+    if not timeline["conditions"]:
+        raise ValueError("Timeline needs at least one condition")
+    if timeline.get("repeat", False) and sum(
+            condition["duration"] for condition in timeline["conditions"]) <= 0:
+        raise ValueError("A repeating timeline needs a non-zero total duration")
+    return timeline
+
+
+class Pipe:
+    """One direction of a proxied connection with delay, loss and bandwidth applied"""
+
+    def __init__(self, proxy, source, destination):
+        self.proxy = proxy
+        self.source = source
+        self.destination = destination
+        self.queue = []
+        self.sequence = 0
+        self.last_delivery = 0
+        self.ready = threading.Condition()
+        self.closed = False
+
+    def start(self):
+        threading.Thread(target=self.receive_loop, daemon=True).start()
+        threading.Thread(target=self.send_loop, daemon=True).start()
+
+    def receive_loop(self):
+        try:
+            while True:
+                data = self.source.recv(4096)
+                if not data:
+                    break
+                self.schedule(data)
+        except OSError:
+            self.close()
+            return
+        # Deliver what is still queued, then close
+        self.finish()
+
+    def schedule(self, data):
+        condition = self.proxy.condition
+        delay = condition.get("delay_ms", 0)
+        jitter = condition.get("jitter_ms", 0)
+        if jitter:
+            delay = max(0, delay + random.uniform(-jitter, jitter))
+        if random.random() * 100 < condition.get("loss", 0):
+            delay += RETRANSMIT_DELAY_MS
+
+        # Keep the byte stream in order even when jitter reorders deadlines
+        deliver_at = max(time.time() + delay / 1000, self.last_delivery)
+        self.last_delivery = deliver_at
+
+        with self.ready:
+            self.sequence += 1
+            heapq.heappush(self.queue, (deliver_at, self.sequence, data))
+            self.ready.notify()
+
+    def send_loop(self):
+        try:
+            while True:
+                with self.ready:
+                    while not self.queue and not self.closed:
+                        self.ready.wait()
+                    if not self.queue:
+                        break
+                    deliver_at, _, data = self.queue[0]
+                    wait = deliver_at - time.time()
+                    if wait > 0:
+                        self.ready.wait(wait)
+                        continue
+                    heapq.heappop(self.queue)
+
+                self.destination.sendall(data)
+
+                # Bandwidth cap in bytes per second
+                bandwidth = self.proxy.condition.get("bandwidth", 0)
+                if bandwidth:
+                    time.sleep(len(data) / bandwidth)
+        except OSError:
+            pass
+        self.close()
+
+    def finish(self):
+        with self.ready:
+            self.closed = True
+            self.ready.notify()
+
+    def close(self):
+        self.finish()
+        for sock in (self.source, self.destination):
+            # shutdown() wakes up the other pipe blocked in recv() on this socket
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+class ImpairmentProxy:
+    """TCP proxy in front of the broker that follows a scripted impairment timeline"""
+
+    def __init__(self, target_host, target_port, timeline,
+                 listen_host="0.0.0.0", listen_port=1884):
+        self.target = (target_host, target_port)
+        self.listen = (listen_host, listen_port)
+        self.timeline = timeline
+        self.condition = BASELINE
+        self.pipes = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    @property
+    def condition_name(self):
+        return self.condition["name"]
+
+    def start(self):
+        self.server = socket.create_server(self.listen)
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        threading.Thread(target=self.timeline_loop, daemon=True).start()
+        print(f"Impairment proxy listening on {self.listen[0]}:{self.listen[1]} "
+              f"-> {self.target[0]}:{self.target[1]}")
+
+    def stop(self):
+        self.stop_event.set()
+        self.condition = BASELINE
+        self.server.close()
+        self.disconnect_all()
+
+    def accept_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                break
+
+            # Refuse connections during a scripted outage
+            if self.condition.get("disconnect"):
+                client.close()
+                continue
+
+            try:
+                upstream = socket.create_connection(self.target, timeout=10)
+                upstream.settimeout(None)
+            except OSError as e:
+                print(f"Proxy could not reach broker: {e}")
+                client.close()
+                continue
+
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            pipes = [Pipe(self, client, upstream), Pipe(self, upstream, client)]
+            with self.lock:
+                self.pipes = [p for p in self.pipes if not p.closed] + pipes
+            for pipe in pipes:
+                pipe.start()
+
+    def disconnect_all(self):
+        with self.lock:
+            pipes, self.pipes = self.pipes, []
+        for pipe in pipes:
+            pipe.close()
+
+    def timeline_loop(self):
+        while not self.stop_event.is_set():
+            for condition in self.timeline["conditions"]:
+                self.condition = condition
+                print(f"Network condition: {condition['name']}")
+                if condition.get("disconnect"):
+                    self.disconnect_all()
+                if self.stop_event.wait(condition["duration"]):
+                    return
+
+            if not self.timeline.get("repeat", False):
+                break
+
+        self.condition = BASELINE
+        print("Impairment timeline finished")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inject scripted network impairments between MQTT clients and the broker")
+    parser.add_argument("timeline", help="JSON timeline of network conditions")
+    parser.add_argument("--target", default="127.0.0.1:1883", help="broker host:port")
+    parser.add_argument("--listen", default="0.0.0.0:1884", help="proxy host:port")
+    args = parser.parse_args()
+
+    target_host, target_port = args.target.rsplit(":", 1)
+    listen_host, listen_port = args.listen.rsplit(":", 1)
+    proxy = ImpairmentProxy(target_host, int(target_port), load_timeline(args.timeline),
+                            listen_host, int(listen_port))
+    proxy.start()
+    try:
+        while not proxy.stop_event.wait(1):
+            pass
+    except KeyboardInterrupt:
+        proxy.stop()
+
+
+if __name__ == "__main__":
+    main()
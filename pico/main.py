@@ -1,22 +1,156 @@
 import time
 import gc
+import _thread
 import machine
 from config import MQTT_PORT, MQTT_SERVER, WIFI_PASSWORD, WIFI_SSID
-from sensor_controller import publish_sensor_data
+from sensor_controller import get_link_quality, publish_sensor_data
 from sensors.bmp280 import BMP280
 from sensors.dht22 import DHT22
 from sensors.mq135 import MQ135
 from topic import (TOPIC_BMP280_PRESSURE, TOPIC_BMP280_TEMP,
                    TOPIC_DHT22_HUMIDITY, TOPIC_DHT22_TEMP,
                    TOPIC_MQ135_AIR_QUALITY)
+from utils.deadband import REPORT_ALWAYS, Deadband
 from utils.mqtt import connect_mqtt
+from utils.rate import RateController
+from utils.ring import RingBuffer
 from utils.wifi import connect_wifi
 
+# Sample on the second core (core 1) and publish from this one, so blocking
+# network I/O (reconnects, PUBACK waits) can't delay or skew the sampling
+DUAL_CORE = False
+
+# Samples core 1 can buffer while core 0 is busy with the network
+RING_SIZE = 64
+
+# How long core 0 waits before polling an empty ring buffer again
+DRAIN_INTERVAL_MS = 20
+
 # Initialize sensors
 temp_sensor = DHT22(9)
-smoke_sensor = MQ135(26)
+smoke_sensor = MQ135(26, burst_size=64)
 pressure_sensor = BMP280(0, 1)
 
+# Published readings, in the order returned by read_sensors(), with their
+# report-by-exception deadband (None publishes every reading) and the
+# oversampled sensor whose window statistics are sent along (or None)
+READINGS = (
+    (TOPIC_DHT22_TEMP, "DHT22_TEMP", Deadband(absolute=0.2), None),
+    (TOPIC_DHT22_HUMIDITY, "DHT22_HUMIDITY", Deadband(absolute=1.0), None),
+    (TOPIC_BMP280_TEMP, "BMP280_TEMP", Deadband(absolute=0.2), None),
+    (TOPIC_BMP280_PRESSURE, "BMP280_PRESSURE", Deadband(relative=0.0005), None),
+    (TOPIC_MQ135_AIR_QUALITY, "MQ135_AIR_QUALITY", Deadband(relative=0.02), smoke_sensor),
+)
+
+# Guards the MQ135 window statistics, accumulated by burst() and read and
+# reset by publish_batch(), which run on different cores in dual-core mode
+stats_lock = _thread.allocate_lock()
+
+def read_sensors():
+    """Take one sample of every reading"""
+    dht_temp, humidity = temp_sensor.get_value()
+    bmp_temp, pressure = pressure_sensor.get_value()
+    with stats_lock:
+        smoke = smoke_sensor.burst()
+    return dht_temp, humidity, bmp_temp, pressure, smoke
+
+def publish_batch(client, wlan, rate, sums, samples, timestamp=None):
+    """Publish the batch mean of every reading, skipping readings that
+    stayed within their deadband. Returns False if a publish failed"""
+    ok = True
+    for (topic, sensor_id, deadband, sampled), total in zip(READINGS, sums):
+        value = total / samples
+        reason = deadband.check(value) if deadband else REPORT_ALWAYS
+        if reason is None or not ok:
+            # After a failed publish the remaining readings still go through
+            # their deadband, so the batches they suppress are counted
+            continue
+        
+        # Window statistics cover every sample since the last published
+        # reading, including batches the deadband suppressed or that failed
+        # to publish
+        stats = None
+        if sampled:
+            with stats_lock:
+                stats = sampled.window_stats()
+        ok = publish_sensor_data(
+            client,
+            topic,
+            sensor_id,
+            value,
+            wlan,
+            rate=rate,
+            deadband=deadband,
+            reason=reason,
+            stats=stats,
+            timestamp=timestamp,
+        )
+        if ok and sampled:
+            with stats_lock:
+                sampled.reset_stats()
+    return ok
+
+def reconnect(client, wlan):
+    """Re-establish Wi-Fi and MQTT after a failed publish
+
+    umqtt.simple never reconnects on its own: once a publish fails the
+    socket is gone and every later publish fails too.
+    """
+    print("Publish failed, reconnecting...")
+    try:
+        client.disconnect()
+    except Exception:
+        pass
+    
+    if not wlan or not wlan.isconnected():
+        wlan = connect_wifi(WIFI_SSID, WIFI_PASSWORD)
+    if wlan:
+        try:
+            client = connect_mqtt(MQTT_SERVER, MQTT_PORT)
+            connection_stats["reconnects"] += 1
+            connection_stats["last_connection_time"] = time.time()
+        except Exception as e:
+            print(f"Reconnection failed: {e}")
+    return client, wlan
+
+# Set to stop the sampler; it clears sampler_running once it has exited
+sampler_stop = False
+sampler_running = False
+
+def sample_loop(ring, rate):
+    """Core 1: sample every reading on a fixed schedule into the ring buffer"""
+    global sampler_running
+    next_sample = time.ticks_ms()
+    while not sampler_stop:
+        try:
+            ring.put(int(time.time()), read_sensors())
+        except Exception as e:
+            print(f"Error sampling sensors: {e}")
+        
+        # Schedule from the previous deadline so sampling doesn't drift; if
+        # a read overran the interval, restart the schedule from now
+        next_sample = time.ticks_add(next_sample, rate.sample_interval_ms)
+        delay = time.ticks_diff(next_sample, time.ticks_ms())
+        if delay > 0:
+            time.sleep_ms(delay)
+        else:
+            next_sample = time.ticks_ms()
+    sampler_running = False
+
+def start_sampler(ring, rate):
+    global sampler_stop, sampler_running
+    sampler_stop = False
+    sampler_running = True
+    _thread.start_new_thread(sample_loop, (ring, rate))
+
+def stop_sampler(timeout_ms=5000):
+    """Stop core 1 and wait for it to finish its current sample"""
+    global sampler_stop
+    sampler_stop = True
+    started = time.ticks_ms()
+    while sampler_running and time.ticks_diff(time.ticks_ms(), started) < timeout_ms:
+        time.sleep_ms(10)
+
 # Track connection state
 connection_stats = {
     "reconnects": 0,
@@ -38,72 +172,55 @@ def main():
             print(f"Disconnected with code {rc}")
             connection_stats["reconnects"] += 1
         client.on_disconnect = on_disconnect
-    QOS = 1
+    # Adapts sampling/publish intervals, QoS and batch size to the link
+    rate = RateController()
+    sums = [0] * len(READINGS)
+    samples = 0
+    timestamp = None
+    
+    if DUAL_CORE:
+        ring = RingBuffer(RING_SIZE, len(READINGS))
+        sample = [0] * len(READINGS)
+        start_sampler(ring, rate)
+        print("Sampling on core 1")
     try:
         while True:
+            started = time.ticks_ms()
             try:
-                # DHT22 Temperature
-                publish_sensor_data(
-                    client,
-                    TOPIC_DHT22_TEMP,
-                    "DHT22_TEMP",
-                    temp_sensor.get_value()[0],
-                    wlan,
-                    qos=QOS,
-                )
-                
-                # DHT22 Humidity
-                publish_sensor_data(
-                    client,
-                    TOPIC_DHT22_HUMIDITY,
-                    "DHT22_HUMIDITY",
-                    temp_sensor.get_value()[1],
-                    wlan,
-                    qos=QOS,
-                )
-                
-                # BMP280 Temperature
-                publish_sensor_data(
-                    client,
-                    TOPIC_BMP280_TEMP,
-                    "BMP280_TEMP",
-                    pressure_sensor.get_value()[0],
-                    wlan,
-                    qos=QOS,
-                )
+                # Take one sample of every reading, or the oldest one
+                # buffered by core 1 along with its sampling time
+                if DUAL_CORE:
+                    timestamp = ring.get(sample)
+                    if timestamp is None:
+                        time.sleep_ms(DRAIN_INTERVAL_MS)
+                        continue
+                else:
+                    sample = read_sensors()
                 
-                # BMP280 Pressure
-                publish_sensor_data(
-                    client,
-                    TOPIC_BMP280_PRESSURE,
-                    "BMP280_PRESSURE",
-                    pressure_sensor.get_value()[1],
-                    wlan,
-                    qos=QOS,
-                )
+                for i, value in enumerate(sample):
+                    sums[i] += value
+                samples += 1
                 
-                # MQ135 Air Quality
-                publish_sensor_data(
-                    client,
-                    TOPIC_MQ135_AIR_QUALITY,
-                    "MQ135_AIR_QUALITY",
-                    smoke_sensor.get_value(),
-                    wlan,
-                    qos=QOS,
-                )
+                # Publish the batch mean once enough samples are collected
+                if samples >= rate.batch_size:
+                    if not publish_batch(client, wlan, rate, sums, samples, timestamp):
+                        connection_stats["message_failures"] += 1
+                        client, wlan = reconnect(client, wlan)
+                    if DUAL_CORE and ring.dropped:
+                        print(f"Ring buffer full, {ring.dropped} samples dropped")
+                        ring.dropped = 0
+                    sums = [0] * len(READINGS)
+                    samples = 0
+                    rate.update(get_link_quality(wlan)[1])
                     
             except Exception as e:
-                print(f"Error publishing data: {e}")
-                connection_stats["message_failures"] += 1
-                
-                # Try to reconnect if needed
-                if hasattr(client, 'is_connected') and not client.is_connected():
-                    print("MQTT disconnected, attempting to reconnect...")
-                    try:
-                        client = connect_mqtt(MQTT_SERVER, MQTT_PORT)
-                        connection_stats["last_connection_time"] = time.time()
-                    except:
-                        print("Reconnection failed")
+                print(f"Error reading sensors: {e}")
+            
+            # Wait out the rest of the sampling interval (core 1 keeps its
+            # own schedule in dual-core mode)
+            if not DUAL_CORE:
+                elapsed = time.ticks_diff(time.ticks_ms(), started)
+                time.sleep_ms(max(0, rate.sample_interval_ms - elapsed))
             
             
     except KeyboardInterrupt:
@@ -111,9 +228,13 @@ def main():
     except Exception as e:
         print(f"Unexpected error: {e}")
     finally:
+        if DUAL_CORE:
+            stop_sampler()
         # Perform clean disconnect
-        if hasattr(client, 'disconnect'):
+        try:
             client.disconnect()
+        except Exception:
+            pass
         print("Program terminated")
 
 if __name__ == "__main__":
@@ -1,20 +1,29 @@
 import time
-import ubinascii
 import machine
 import gc
 import network
+from utils.deadband import REPORT_ALWAYS
+from utils.device import next_message_id
 
-def get_payload(sensor_id, value, wlan):
-    timestamp = time.time()
-    message_id = ubinascii.hexlify(str(timestamp).encode()).decode()
-    
-    # Network information
+def get_link_quality(wlan):
+    """Return (RSSI, approximate link quality 0-100) of the WiFi link"""
     if wlan and wlan.isconnected():
         wifi_rssi = wlan.status("rssi")
         link_quality = max(0, min(100, (wifi_rssi + 100) * 2))  # Convert RSSI to approximate quality
     else:
         wifi_rssi = 0
         link_quality = 0
+    return wifi_rssi, link_quality
+
+def get_payload(sensor_id, value, wlan, qos=0, rate=None, deadband=None, reason=REPORT_ALWAYS,
+                stats=None, timestamp=None):
+    # Sampling time when the reading was buffered, otherwise now
+    if timestamp is None:
+        timestamp = time.time()
+    message_id = next_message_id()
+    
+    # Network information
+    wifi_rssi, link_quality = get_link_quality(wlan)
     
     # System information
     try:
@@ -38,27 +47,56 @@ def get_payload(sensor_id, value, wlan):
         f"{link_quality},"       # Link quality estimate
         f"{mem_percent},"        # Memory usage percent
         f"{cpu_freq},"           # CPU frequency (MHz)
-        f"{machine.reset_cause()}"  # Last reset cause
+        f"{machine.reset_cause()},"  # Last reset cause
+        f"{qos},"                # Requested QoS level
     )
     
+    # Rate controller decisions: publish interval, samples per publish, level
+    if rate:
+        payload += f"{rate.interval_ms},{rate.batch_size},{rate.level},"
+    else:
+        payload += "0,1,0,"
+    
+    # Report-by-exception: reason, readings suppressed since the last report
+    # and the heartbeat interval (the longest gap between reports)
+    if deadband:
+        payload += f"{reason},{deadband.suppressed},{deadband.heartbeat_ms},"
+    else:
+        payload += f"{reason},0,0,"
+    
+    # Oversampling window summary as min:max:stddev:samples (empty if none)
+    if stats:
+        payload += f"{stats[1]}:{stats[2]}:{stats[3]:.1f}:{stats[4]}"
+    
     return payload
 
-def publish_sensor_data(client, topic, sensor_id, value, wlan, qos=0, retain=False):
+def publish_sensor_data(client, topic, sensor_id, value, wlan, qos=0, retain=False, rate=None,
+                        deadband=None, reason=REPORT_ALWAYS, stats=None, timestamp=None):
+    # The rate controller, when given, decides the QoS level
+    if rate:
+        qos = rate.qos
+    
+    # Record attempt time for tracking delivery success
+    start_time = time.ticks_ms()
     try:
-        payload = get_payload(sensor_id, value, wlan)
+        payload = get_payload(sensor_id, value, wlan, qos, rate, deadband, reason, stats,
+                              timestamp)
         print(f"Publishing to {topic}: {payload}")
         
-        # Record attempt time for tracking delivery success
-        start_time = time.time()
-        
-        # Publish with QoS level
+        # Publish with QoS level (waits for PUBACK when qos=1)
         result = client.publish(topic, payload, qos=qos, retain=retain)
         
-        # Calculate publishing time (local processing only)
-        pub_time = time.time() - start_time
-        print(f"Local processing time: {pub_time*1000:.2f}ms")
+        # Calculate publishing time (including the PUBACK wait)
+        pub_time = time.ticks_diff(time.ticks_ms(), start_time)
+        print(f"Publish time: {pub_time}ms")
+        if rate:
+            rate.record(True, pub_time, qos)
+        if deadband:
+            deadband.reported(value)
         
         return True
     except Exception as e:
         print(f"Publish error: {e}")
+        if rate:
+            rate.record(False, time.ticks_diff(time.ticks_ms(), start_time))
         return False
\ No newline at end of file
@@ -1,9 +1,76 @@
+import math
+import time
+from array import array
+
+import micropython
 from machine import ADC
 
 
 class MQ135:
-    def __init__(self, out_pin):
+    def __init__(self, out_pin, burst_size=64, burst_interval_us=100):
         self.sensor = ADC(out_pin)
+        self.burst_interval_us = burst_interval_us
+        # Preallocated so bursts don't allocate on the heap
+        self.buffer = array("H", bytes(2 * burst_size))
+        self.reset_stats()
     
     def get_value(self):
-        return self.sensor.read_u16()
\ No newline at end of file
+        return self.sensor.read_u16()
+    
+    def reset_stats(self):
+        self.count = 0
+        self.total = 0
+        self.total12 = 0
+        self.total_sq = 0
+        self.low = 0xFFFF
+        self.high = 0
+    
+    @micropython.native
+    def burst(self):
+        """Oversample the ADC into the buffer and return the burst mean"""
+        buffer = self.buffer
+        read = self.sensor.read_u16
+        interval = self.burst_interval_us
+        n = len(buffer)
+        for i in range(n):
+            buffer[i] = read()
+            if interval:
+                time.sleep_us(interval)
+        
+        # Single pass over the buffer. The spread is computed at the 12-bit
+        # ADC resolution (read_u16 scales it up to 16 bits) to keep the sums
+        # small; the mean keeps the full read_u16 value
+        total = 0
+        total12 = 0
+        total_sq = 0
+        low = self.low
+        high = self.high
+        for i in range(n):
+            value = buffer[i]
+            total += value
+            raw = value >> 4
+            total12 += raw
+            total_sq += raw * raw
+            if value < low:
+                low = value
+            if value > high:
+                high = value
+        
+        self.count += n
+        self.total += total
+        self.total12 += total12
+        self.total_sq += total_sq
+        self.low = low
+        self.high = high
+        return total / n
+    
+    def window_stats(self):
+        """Return (mean, min, max, stddev, samples) since the last reset_stats()"""
+        n = self.count
+        if n == 0:
+            return None
+        mean = self.total / n
+        # Integer numerator: with single-precision floats the difference of
+        # the two mean squares would cancel out the ADC noise
+        variance = (n * self.total_sq - self.total12 * self.total12) / (n * n) * 256
+        return (mean, self.low, self.high, math.sqrt(variance), n)
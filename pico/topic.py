@@ -1,5 +1,10 @@
-TOPIC_BMP280_TEMP = "sensor/bmp280/temp"
-TOPIC_BMP280_PRESSURE = "sensor/bmp280/pressure"
-TOPIC_DHT22_TEMP = "sensor/dht22/temp"
-TOPIC_DHT22_HUMIDITY = "sensor/dht22/humidity"
-TOPIC_MQ135_AIR_QUALITY = "sensor/mq135/air_quality"
+from utils.device import DEVICE_ID
+
+# Topics are namespaced per board so one subscriber can serve a whole fleet
+TOPIC_PREFIX = f"sensor/{DEVICE_ID}"
+
+TOPIC_BMP280_TEMP = f"{TOPIC_PREFIX}/bmp280/temp"
+TOPIC_BMP280_PRESSURE = f"{TOPIC_PREFIX}/bmp280/pressure"
+TOPIC_DHT22_TEMP = f"{TOPIC_PREFIX}/dht22/temp"
+TOPIC_DHT22_HUMIDITY = f"{TOPIC_PREFIX}/dht22/humidity"
+TOPIC_MQ135_AIR_QUALITY = f"{TOPIC_PREFIX}/mq135/air_quality"
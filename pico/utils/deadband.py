@@ -0,0 +1,43 @@
+import time
+
+# Why a reading was published
+REPORT_ALWAYS = "a"     # Deadband disabled, every reading is sent
+REPORT_CHANGE = "c"     # Value moved beyond the deadband
+REPORT_HEARTBEAT = "h"  # No change, but the heartbeat interval elapsed
+
+
+class Deadband:
+    """Report-by-exception filter for one reading
+
+    A value is reported when it differs from the last reported value by
+    more than ``absolute`` or by more than ``relative`` times that value,
+    or when nothing has been reported for ``heartbeat_ms``.
+    """
+
+    def __init__(self, absolute=0, relative=0, heartbeat_ms=60000):
+        self.absolute = absolute
+        self.relative = relative
+        self.heartbeat_ms = heartbeat_ms
+        self.last_value = None
+        self.last_report = 0
+        self.suppressed = 0
+
+    def check(self, value):
+        """Return the report reason for value, or None to suppress it"""
+        if self.last_value is None:
+            return REPORT_CHANGE
+        if time.ticks_diff(time.ticks_ms(), self.last_report) >= self.heartbeat_ms:
+            return REPORT_HEARTBEAT
+
+        band = max(self.absolute, abs(self.last_value) * self.relative)
+        if abs(value - self.last_value) > band:
+            return REPORT_CHANGE
+
+        self.suppressed += 1
+        return None
+
+    def reported(self, value):
+        """Record that value was published"""
+        self.last_value = value
+        self.last_report = time.ticks_ms()
+        self.suppressed = 0
@@ -0,0 +1,19 @@
+import os
+
+import machine
+import ubinascii
+
+# Stable identity of this board
+DEVICE_ID = ubinascii.hexlify(machine.unique_id()).decode()
+
+# Random per-boot nonce so sequence numbers never repeat across resets
+BOOT_ID = ubinascii.hexlify(os.urandom(2)).decode()
+
+_sequence = 0
+
+
+def next_message_id():
+    """Return a message ID unique for this device: <device>-<boot>-<sequence>"""
+    global _sequence
+    _sequence += 1
+    return f"{DEVICE_ID}-{BOOT_ID}-{_sequence}"
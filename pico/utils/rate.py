@@ -0,0 +1,83 @@
+# Rate levels from full resolution to the most conservative:
+# (sample interval ms, samples per publish, QoS)
+RATE_LEVELS = (
+    (1000, 1, 1),
+    (1000, 3, 1),
+    (2000, 5, 1),
+    (5000, 6, 0),
+)
+
+# Thresholds that push the controller to at least the given level:
+# (level, min link quality, max ack latency ms)
+LEVEL_LIMITS = (
+    (1, 60, 200),
+    (2, 40, 500),
+    (3, 20, 1000),
+)
+
+
+class RateController:
+    """Picks publish interval, QoS and batch size from link conditions
+
+    Backs off immediately when the link degrades and steps back up one
+    level at a time after ``recover_after`` healthy updates.
+    """
+
+    def __init__(self, recover_after=5):
+        self.recover_after = recover_after
+        self.level = 0
+        self.ack_ms = 0
+        self.failures = 0
+        self.healthy_updates = 0
+
+    @property
+    def sample_interval_ms(self):
+        return RATE_LEVELS[self.level][0]
+
+    @property
+    def batch_size(self):
+        return RATE_LEVELS[self.level][1]
+
+    @property
+    def qos(self):
+        return RATE_LEVELS[self.level][2]
+
+    @property
+    def interval_ms(self):
+        return self.sample_interval_ms * self.batch_size
+
+    def record(self, ok, ack_ms, qos=1):
+        """Record the outcome and duration of one publish"""
+        if ok:
+            # Smoothed PUBACK round trip. A QoS 0 publish returns as soon as
+            # the socket write does, so it says nothing about the round trip.
+            if qos:
+                self.ack_ms = ack_ms if self.ack_ms == 0 else (3 * self.ack_ms + ack_ms) // 4
+        else:
+            self.failures += 1
+
+    def update(self, link_quality):
+        """Re-evaluate the rate level after a batch has been published"""
+        # At a QoS 0 level the estimate is stale: only link quality and
+        # failures decide whether to stay
+        ack_ms = self.ack_ms if self.qos else 0
+        target = 0
+        for level, min_quality, max_ack_ms in LEVEL_LIMITS:
+            if link_quality < min_quality or ack_ms > max_ack_ms:
+                target = level
+        if self.failures:
+            target = max(target, min(self.level + 1, len(RATE_LEVELS) - 1))
+        self.failures = 0
+
+        if target >= self.level:
+            self.level = target
+            self.healthy_updates = 0
+        else:
+            self.healthy_updates += 1
+            if self.healthy_updates >= self.recover_after:
+                if not self.qos:
+                    # Back to QoS 1: start a fresh round-trip estimate
+                    self.ack_ms = 0
+                self.level -= 1
+                self.healthy_updates = 0
+        return self.level
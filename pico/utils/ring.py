@@ -0,0 +1,52 @@
+import _thread
+from array import array
+
+
+class RingBuffer:
+    """Fixed-size FIFO of timestamped samples shared between the two cores
+
+    Storage is preallocated so the sampler doesn't allocate on the heap.
+    When the buffer is full the oldest sample is overwritten and counted
+    in ``dropped``. Timestamps are integer seconds: the rp2 port's floats
+    are single precision, which can't hold an epoch time to the second.
+    """
+
+    def __init__(self, size, width):
+        self.size = size
+        self.width = width
+        self.timestamps = array("q", bytes(8 * size))
+        self.values = array("f", bytes(4 * size * width))
+        self.head = 0
+        self.count = 0
+        self.dropped = 0
+        self.lock = _thread.allocate_lock()
+
+    def __len__(self):
+        return self.count
+
+    def put(self, timestamp, values):
+        """Append one sample of ``width`` values taken at ``timestamp`` (int seconds)"""
+        with self.lock:
+            if self.count == self.size:
+                self.head = (self.head + 1) % self.size
+                self.count -= 1
+                self.dropped += 1
+            slot = (self.head + self.count) % self.size
+            self.timestamps[slot] = timestamp
+            base = slot * self.width
+            for i in range(self.width):
+                self.values[base + i] = values[i]
+            self.count += 1
+
+    def get(self, out):
+        """Copy the oldest sample into out and return its timestamp, or None if empty"""
+        with self.lock:
+            if self.count == 0:
+                return None
+            slot = self.head
+            base = slot * self.width
+            for i in range(self.width):
+                out[i] = self.values[base + i]
+            self.head = (slot + 1) % self.size
+            self.count -= 1
+            return self.timestamps[slot]
@@ -0,0 +1,679 @@
+import argparse
+import binascii
+import contextlib
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+PICO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pico")
+
+# Firmware modules, dropped from sys.modules before every load
+FIRMWARE_MODULES = ("main", "config", "topic", "sensor_controller", "sensors", "utils")
+
+# MicroPython ticks wrap around at 2**30
+TICKS_PERIOD = 1 << 30
+TICKS_MAX = TICKS_PERIOD - 1
+TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+# RP2040 heap available to MicroPython after boot
+HEAP_SIZE = 192 * 1024
+
+# Firmware time between measurements of the memory the firmware holds
+MEMORY_REFRESH_S = 10
+
+# Sensor models: every signal is [mean, noise] or [mean, noise, drift per hour]
+DEFAULT_SENSORS = {
+    "dht22": {"latency_ms": 25, "temperature": [21.0, 0.3], "humidity": [45.0, 1.5]},
+    "bmp280": {"latency_ms": 1, "temperature": [21.5, 0.1], "pressure": [101325.0, 8.0]},
+    "mq135": {"latency_us": 2, "raw": [20000, 400]},
+}
+
+# Link conditions, overridden by the active timeline condition
+BASELINE = {
+    "name": "baseline",
+    "rssi": -55,
+    "rssi_jitter": 3,
+    "disconnect": False,  # Wi-Fi down
+    "send_ms": 2,         # time to write a QoS 0 publish
+    "ack_ms": 20,         # time to get the PUBACK of a QoS 1 publish
+    "publish_fail": 0,    # percent of publishes that drop the connection
+    "sensor_fail": 0,     # percent of DHT22 reads that time out
+}
+
+DEFAULT_SCENARIO = {"sensors": DEFAULT_SENSORS, "repeat": False, "conditions": []}
+
+# The running emulator, used by the fake MicroPython modules
+emulator = None
+
+
+def load_scenario(path):
+    """Load a scenario: {"sensors": {...}, "repeat": bool, "conditions": [{"name", "duration", ...}]}"""
+    with open(path, "r") as f:
+        scenario = json.load(f)
+
+    for condition in scenario.get("conditions", []):
+        if "name" not in condition or "duration" not in condition:
+            raise ValueError(f"Condition needs a name and duration: {condition}")
+    return scenario
+
+
+class Clock:
+    """Firmware time
+
+    With speed 0 sleeps return immediately and move the clock forward, so
+    hours of firmware time run in seconds. Otherwise the clock runs at
+    ``speed`` times real time and sleeps really wait, which is needed when
+    the firmware runs a second thread.
+    """
+
+    def __init__(self, speed=0):
+        self.speed = speed
+        self.epoch = int(time.time())
+        self.started = time.perf_counter()
+        self.skipped = 0.0
+        self.lock = threading.Lock()
+
+    def now(self):
+        """Seconds of firmware time since the emulator started"""
+        real = time.perf_counter() - self.started
+        return (real * self.speed if self.speed else real) + self.skipped
+
+    def advance(self, seconds):
+        """Spend seconds of firmware time (a sleep or blocking I/O)"""
+        if seconds <= 0:
+            return
+        if self.speed:
+            time.sleep(seconds / self.speed)
+        else:
+            with self.lock:
+                self.skipped += seconds
+
+
+def signal(spec, t, rng):
+    drift = spec[2] if len(spec) > 2 else 0
+    return spec[0] + drift * t / 3600 + rng.gauss(0, spec[1])
+
+
+# Fake MicroPython modules
+
+def fake_time():
+    module = types.ModuleType("time")
+
+    def sleep(seconds):
+        emulator.sleep(seconds)
+
+    def sleep_ms(ms):
+        emulator.sleep(ms / 1000)
+
+    def sleep_us(us):
+        emulator.clock.advance(us / 1000000)
+
+    def ticks_ms():
+        return int(emulator.clock.now() * 1000) & TICKS_MAX
+
+    def ticks_us():
+        return int(emulator.clock.now() * 1000000) & TICKS_MAX
+
+    def ticks_add(ticks, delta):
+        return (ticks + delta) & TICKS_MAX
+
+    def ticks_diff(end, start):
+        return ((end - start + TICKS_HALFPERIOD) & TICKS_MAX) - TICKS_HALFPERIOD
+
+    def time_():
+        # Integer seconds, like the RP2040 port
+        return emulator.clock.epoch + int(emulator.clock.now())
+
+    module.__dict__.update(
+        sleep=sleep, sleep_ms=sleep_ms, sleep_us=sleep_us, ticks_ms=ticks_ms,
+        ticks_us=ticks_us, ticks_add=ticks_add, ticks_diff=ticks_diff, time=time_,
+        localtime=lambda secs=None: time.localtime(time_() if secs is None else secs),
+    )
+    return module
+
+
+def fake_gc():
+    module = types.ModuleType("gc")
+    module.collect = gc.collect
+    module.enable = gc.enable
+    module.disable = gc.disable
+    module.mem_alloc = lambda: emulator.mem_alloc()
+    module.mem_free = lambda: HEAP_SIZE - emulator.mem_alloc()
+    return module
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+
+    def __init__(self, pin, *args, **kwargs):
+        self.pin = pin
+
+
+class ADC:
+    def __init__(self, pin):
+        self.pin = pin
+
+    def read_u16(self):
+        model = emulator.sensors["mq135"]
+        emulator.clock.advance(model.get("latency_us", 0) / 1000000)
+        raw = signal(model["raw"], emulator.clock.now(), emulator.rng)
+        # The 12-bit conversion scaled up to 16 bits the way the rp2 port does
+        raw = max(0, min(0xFFF, int(raw) >> 4))
+        return raw << 4 | raw >> 8
+
+
+class I2C:
+    def __init__(self, bus, sda=None, scl=None, freq=400000):
+        self.bus = bus
+
+
+def fake_machine():
+    module = types.ModuleType("machine")
+    module.__dict__.update(
+        Pin=Pin, ADC=ADC, I2C=I2C,
+        unique_id=lambda: b"\xe6\x61\x41\x04\x03\x2b\x5a\x2c",
+        freq=lambda: 125000000,
+        reset_cause=lambda: 1,
+        PWRON_RESET=1,
+    )
+    return module
+
+
+class DHT22:
+    def __init__(self, pin):
+        self.pin = pin
+        self.values = (0.0, 0.0)
+
+    def measure(self):
+        model = emulator.sensors["dht22"]
+        emulator.clock.advance(model.get("latency_ms", 0) / 1000)
+        if emulator.rng.random() * 100 < emulator.condition().get("sensor_fail", 0):
+            raise OSError(110)  # ETIMEDOUT, like the real driver
+        t = emulator.clock.now()
+        self.values = (round(signal(model["temperature"], t, emulator.rng), 1),
+                       round(signal(model["humidity"], t, emulator.rng), 1))
+
+    def temperature(self):
+        return self.values[0]
+
+    def humidity(self):
+        return self.values[1]
+
+
+class BMP280I2C:
+    def __init__(self, address, i2c):
+        self.address = address
+        self.i2c = i2c
+
+    @property
+    def measurements(self):
+        model = emulator.sensors["bmp280"]
+        emulator.clock.advance(model.get("latency_ms", 0) / 1000)
+        t = emulator.clock.now()
+        return {"t": signal(model["temperature"], t, emulator.rng),
+                "p": signal(model["pressure"], t, emulator.rng)}
+
+
+class WLAN:
+    def __init__(self, interface=0):
+        self.interface = interface
+        self.enabled = False
+
+    def active(self, active=None):
+        if active is not None:
+            self.enabled = active
+        return self.enabled
+
+    def connect(self, ssid, password):
+        self.ssid = ssid
+
+    def disconnect(self):
+        pass
+
+    def isconnected(self):
+        return self.enabled and emulator.link_up()
+
+    def status(self, param=None):
+        if param == "rssi":
+            condition = emulator.condition()
+            return int(condition["rssi"] + emulator.rng.uniform(
+                -condition["rssi_jitter"], condition["rssi_jitter"]))
+        return 3 if self.isconnected() else 0  # STAT_GOT_IP
+
+    def ifconfig(self):
+        return ("192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+
+
+def fake_network():
+    module = types.ModuleType("network")
+    module.__dict__.update(WLAN=WLAN, STA_IF=0, AP_IF=1)
+    return module
+
+
+class MQTTClient:
+    """umqtt.simple client publishing to the emulator's broker
+
+    Like umqtt.simple it never reconnects on its own: once the connection
+    drops every publish fails until connect() is called again.
+    """
+
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0,
+                 ssl=False, ssl_params=None):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.connected = False
+
+    def connect(self, clean_session=True):
+        emulator.clock.advance(emulator.condition()["ack_ms"] / 1000)
+        if not emulator.link_up():
+            raise OSError(103)  # ECONNABORTED
+        self.connected = True
+        return False
+
+    def disconnect(self):
+        self.connected = False
+
+    def ping(self):
+        if not self.connected:
+            raise OSError(104)
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        condition = emulator.condition()
+        sent = self.connected and emulator.link_up()
+        if sent and emulator.rng.random() * 100 < condition["publish_fail"]:
+            sent = self.connected = False
+        emulator.clock.advance(condition["ack_ms" if qos else "send_ms"] / 1000)
+        emulator.broker.publish(topic, msg, qos, sent, condition["name"])
+        if not sent:
+            self.connected = False
+            raise OSError(104)  # ECONNRESET
+
+
+def fake_micropython():
+    module = types.ModuleType("micropython")
+    module.__dict__.update(
+        native=lambda f: f,
+        viper=lambda f: f,
+        const=lambda value: value,
+        alloc_emergency_exception_buf=lambda size: None,
+    )
+    return module
+
+
+class Broker:
+    """Records publishes, optionally forwarding them to a real MQTT broker"""
+
+    def __init__(self, forward=None):
+        self.messages = []
+        self.client = None
+        if forward:
+            # Imported here so in-memory runs don't need paho
+            import paho.mqtt.client as mqtt
+
+            host, port = forward
+            self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1,
+                                      client_id="pico_emulator")
+            self.client.connect(host, port)
+            self.client.loop_start()
+
+    def publish(self, topic, payload, qos, sent, condition):
+        self.messages.append((emulator.clock.now(), topic, len(payload), qos, sent, condition))
+        if sent and self.client:
+            info = self.client.publish(topic, payload, qos=qos)
+            if qos:
+                info.wait_for_publish(timeout=5)
+
+    def close(self):
+        if self.client:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+
+class FirmwareOutput:
+    """Swallows firmware prints, keeping count of the error messages"""
+
+    def __init__(self, echo=False, keep=5):
+        self.echo = echo
+        self.keep = keep
+        self.errors = 0
+        self.last_errors = []
+
+    def write(self, text):
+        if self.echo:
+            sys.__stdout__.write(text)
+        for line in text.splitlines():
+            if "error" in line.lower() or "failed" in line.lower():
+                self.errors += 1
+                self.last_errors = (self.last_errors + [line])[-self.keep:]
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class CallStats:
+    """Timings of one firmware function"""
+
+    def __init__(self):
+        self.starts = []
+        self.virtual_ms = []
+        self.real_us = []
+        self.alloc_peak = 0
+
+    def summary(self):
+        if not self.starts:
+            return {"calls": 0}
+        intervals = [(b - a) * 1000 for a, b in zip(self.starts, self.starts[1:])]
+        result = {
+            "calls": len(self.starts),
+            "real_us_mean": statistics.fmean(self.real_us),
+            "real_us_p99": percentile(self.real_us, 0.99),
+            "virtual_ms_mean": statistics.fmean(self.virtual_ms),
+            "virtual_ms_max": max(self.virtual_ms),
+            "alloc_peak_bytes": self.alloc_peak,
+        }
+        if len(intervals) > 1:
+            result.update(
+                interval_ms_mean=statistics.fmean(intervals),
+                interval_ms_std=statistics.pstdev(intervals),
+                interval_ms_max=max(intervals),
+            )
+        return result
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Emulator:
+    """Runs the Pico firmware (pico/main.py) on CPython against fake hardware"""
+
+    def __init__(self, scenario=None, speed=0, dual_core=False, broker=None, seed=None,
+                 pico_dir=PICO_DIR, verbose=False):
+        scenario = scenario or DEFAULT_SCENARIO
+        self.sensors = {name: dict(model, **scenario.get("sensors", {}).get(name, {}))
+                        for name, model in DEFAULT_SENSORS.items()}
+        self.conditions = scenario.get("conditions", [])
+        self.repeat = scenario.get("repeat", False)
+        self.speed = speed
+        self.dual_core = dual_core
+        self.forward = broker
+        self.pico_dir = pico_dir
+        self.rng = random.Random(seed)
+        self.output = FirmwareOutput(echo=verbose)
+        self.calls = {}
+        self.deadline = None
+        self.stopping = False
+        self.firmware_memory = 0
+        self.memory_refreshed = None
+
+    def condition(self):
+        """Link condition active at the current firmware time"""
+        t = self.clock.now()
+        period = sum(condition["duration"] for condition in self.conditions)
+        if period and (self.repeat or t < period):
+            t %= period
+            for condition in self.conditions:
+                if t < condition["duration"]:
+                    return dict(BASELINE, **condition)
+                t -= condition["duration"]
+        return BASELINE
+
+    def link_up(self):
+        return not self.condition()["disconnect"]
+
+    def mem_alloc(self):
+        """Heap held by the firmware's own code, as of the last refresh_memory()"""
+        return min(HEAP_SIZE, self.firmware_memory)
+
+    def refresh_memory(self):
+        """Re-measure the firmware's memory every MEMORY_REFRESH_S of firmware time
+
+        Only allocations made from pico/ count: the emulator's own state
+        (recorded messages, timings) would otherwise fill the fake heap.
+        A snapshot is slow, so it is taken outside the timed calls.
+        """
+        now = self.clock.now()
+        if (self.memory_refreshed is not None
+                and now - self.memory_refreshed < MEMORY_REFRESH_S):
+            return
+        self.memory_refreshed = now
+        self.firmware_memory = sum(
+            trace.size for trace in self.firmware_snapshot().traces)
+
+    def sleep(self, seconds):
+        """Firmware sleep; ends the run once the duration has elapsed"""
+        self.clock.advance(seconds)
+        if (self.deadline is not None and not self.stopping
+                and self.clock.now() >= self.deadline
+                and threading.current_thread() is threading.main_thread()):
+            self.stopping = True
+            raise KeyboardInterrupt
+
+    def timed(self, name, function):
+        """Wrap a firmware function to record its timings and allocations"""
+        stats = self.calls[name] = CallStats()
+
+        def wrapper(*args, **kwargs):
+            self.refresh_memory()
+            started = self.clock.now()
+            real = time.perf_counter()
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.real_us.append((time.perf_counter() - real) * 1000000)
+                stats.virtual_ms.append((self.clock.now() - started) * 1000)
+                stats.starts.append(started)
+                stats.alloc_peak = max(stats.alloc_peak,
+                                       tracemalloc.get_traced_memory()[1] - before)
+
+        return wrapper
+
+    def fake_modules(self):
+        umqtt = types.ModuleType("umqtt")
+        umqtt_simple = types.ModuleType("umqtt.simple")
+        umqtt_simple.MQTTClient = MQTTClient
+        umqtt.simple = umqtt_simple
+
+        config = types.ModuleType("config")
+        config.__dict__.update(MQTT_SERVER="emulator", MQTT_PORT=1883,
+                               WIFI_SSID="emulator", WIFI_PASSWORD="emulator")
+
+        bmp280 = types.ModuleType("bmp280")
+        bmp280.BMP280I2C = BMP280I2C
+        dht = types.ModuleType("dht")
+        dht.DHT22 = DHT22
+
+        return {
+            "time": fake_time(),
+            "gc": fake_gc(),
+            "machine": fake_machine(),
+            "network": fake_network(),
+            "micropython": fake_micropython(),
+            "ubinascii": binascii,
+            "umqtt": umqtt,
+            "umqtt.simple": umqtt_simple,
+            "config": config,
+            "bmp280": bmp280,
+            "dht": dht,
+        }
+
+    def load_firmware(self):
+        """Import pico/main.py with the fake modules in place of MicroPython's"""
+        for name in list(sys.modules):
+            if name.split(".")[0] in FIRMWARE_MODULES:
+                del sys.modules[name]
+
+        fakes = self.fake_modules()
+        # time and gc are only swapped while the firmware imports them
+        saved = {name: sys.modules.get(name) for name in fakes}
+        sys.modules.update(fakes)
+        sys.path.insert(0, self.pico_dir)
+        try:
+            import main
+        finally:
+            sys.path.remove(self.pico_dir)
+            for name, module in saved.items():
+                if module is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = module
+
+        main.DUAL_CORE = self.dual_core
+        main.read_sensors = self.timed("read_sensors", main.read_sensors)
+        main.publish_batch = self.timed("publish_batch", main.publish_batch)
+        return main
+
+    def run(self, duration):
+        """Run the firmware for duration seconds of firmware time and return a report"""
+        global emulator
+        emulator = self
+        self.clock = Clock(self.speed)
+        self.broker = Broker(self.forward)
+        self.deadline = duration
+        self.stopping = False
+
+        tracemalloc.start()
+        self.memory_refreshed = None
+        real_started = time.perf_counter()
+        loaded = None
+        crash = None
+        try:
+            with contextlib.redirect_stdout(self.output):
+                main = self.load_firmware()
+                loaded = self.firmware_snapshot()
+                main.main()
+        except BaseException as e:  # The firmware is not supposed to return early
+            crash = f"{type(e).__name__}: {e}"
+        real_elapsed = time.perf_counter() - real_started
+
+        # Memory the firmware code still holds compared to right after import
+        growth = self.firmware_snapshot().compare_to(loaded, "lineno") if loaded else []
+        tracemalloc.stop()
+        self.broker.close()
+        emulator = None
+        return self.report(duration, real_elapsed, growth, crash)
+
+    def firmware_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(True, os.path.join(self.pico_dir, "*"))])
+
+    def report(self, duration, real_elapsed, growth, crash):
+        messages = self.broker.messages
+        sent = [m for m in messages if m[4]]
+        conditions = {}
+        for _, _, _, _, ok, condition in messages:
+            counts = conditions.setdefault(condition, {"sent": 0, "failed": 0})
+            counts["sent" if ok else "failed"] += 1
+        topics = {}
+        for m in sent:
+            topics[m[1]] = topics.get(m[1], 0) + 1
+
+        growth = sorted(growth, key=lambda stat: stat.size_diff, reverse=True)
+        return {
+            "firmware_seconds": self.clock.now(),
+            "real_seconds": real_elapsed,
+            "dual_core": self.dual_core,
+            "crash": crash,
+            "calls": {name: stats.summary() for name, stats in self.calls.items()},
+            "publishes": {
+                "sent": len(sent),
+                "failed": len(messages) - len(sent),
+                "per_minute": len(sent) * 60 / max(duration, 1),
+                "payload_bytes_mean": statistics.fmean(m[2] for m in sent) if sent else 0,
+                "topics": topics,
+                "conditions": conditions,
+            },
+            "memory": {
+                "growth_bytes": sum(stat.size_diff for stat in growth),
+                "top": [f"{os.path.relpath(str(stat.traceback), self.pico_dir)}: "
+                        f"{stat.size_diff:+} B" for stat in growth[:5] if stat.size_diff],
+            },
+            "errors": {"count": self.output.errors, "last": self.output.last_errors},
+        }
+
+
+def print_report(report):
+    mode = "dual core" if report["dual_core"] else "single core"
+    print(f"Emulated {report['firmware_seconds']:.0f} s of firmware time "
+          f"in {report['real_seconds']:.1f} s ({mode})")
+    if report["crash"]:
+        print(f"Firmware stopped with {report['crash']}")
+
+    for name, stats in report["calls"].items():
+        if not stats["calls"]:
+            print(f"{name}: never called")
+            continue
+        print(f"{name}: {stats['calls']} calls, {stats['real_us_mean']:.0f} us mean / "
+              f"{stats['real_us_p99']:.0f} us p99 on this CPU, "
+              f"{stats['virtual_ms_mean']:.1f} ms mean / {stats['virtual_ms_max']:.1f} ms max "
+              f"incl. simulated I/O, peak {stats['alloc_peak_bytes']} B allocated")
+        if "interval_ms_mean" in stats:
+            print(f"  interval {stats['interval_ms_mean']:.1f} ms mean, "
+                  f"{stats['interval_ms_std']:.1f} ms std, {stats['interval_ms_max']:.1f} ms max")
+
+    publishes = report["publishes"]
+    print(f"Publishes: {publishes['sent']} sent, {publishes['failed']} failed, "
+          f"{publishes['per_minute']:.1f}/min, {publishes['payload_bytes_mean']:.0f} B mean payload")
+    for condition, counts in publishes["conditions"].items():
+        print(f"  {condition}: {counts['sent']} sent, {counts['failed']} failed")
+
+    memory = report["memory"]
+    print(f"Firmware memory growth during the run: {memory['growth_bytes']:+} B")
+    for line in memory["top"]:
+        print(f"  {line}")
+
+    errors = report["errors"]
+    print(f"Firmware errors: {errors['count']}")
+    for line in errors["last"]:
+        print(f"  {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the Pico firmware on this machine against emulated sensors, Wi-Fi and MQTT")
+    parser.add_argument("scenario", nargs="?", help="JSON scenario of sensors and link conditions")
+    parser.add_argument("--duration", type=float, default=600,
+                        help="firmware seconds to run (default 600)")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="firmware time per real second; 0 skips sleeps (default)")
+    parser.add_argument("--dual-core", action="store_true",
+                        help="run the firmware with DUAL_CORE enabled (needs --speed)")
+    parser.add_argument("--broker", help="also publish to a real broker at host:port")
+    parser.add_argument("--seed", type=int, help="random seed for sensor values and failures")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show the firmware output")
+    args = parser.parse_args()
+
+    if args.dual_core and not args.speed:
+        parser.error("--dual-core needs --speed, sleeps can't be skipped with two threads")
+
+    broker = None
+    if args.broker:
+        host, port = args.broker.rsplit(":", 1)
+        broker = (host, int(port))
+
+    scenario = load_scenario(args.scenario) if args.scenario else None
+    report = Emulator(scenario, args.speed, args.dual_core, broker, args.seed,
+                      verbose=args.verbose).run(args.duration)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
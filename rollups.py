@@ -0,0 +1,261 @@
+import csv
+import datetime
+import glob
+import json
+import math
+import os
+import time
+
+# Rollup granularities: name -> (bucket seconds, partition date format)
+# Closed buckets are appended to one CSV partition per day, month or year
+GRANULARITIES = {
+    "1m": (60, "%Y-%m-%d"),
+    "1h": (3600, "%Y-%m"),
+    "1d": (86400, "%Y"),
+}
+
+# Default retention in days per granularity (None keeps forever)
+DEFAULT_RETENTION = {"1m": 14, "1h": 365, "1d": None}
+
+# Log-spaced latency histogram: bin k holds latencies up to LATENCY_BASE * GROWTH**k ms
+LATENCY_BASE = 1.0
+LATENCY_GROWTH = 1.2
+LATENCY_BINS = 64
+
+ISSUE_TYPES = 6
+
+# Open buckets saved on close and reloaded on start, so a restart continues
+# them instead of writing a second row for the same period
+STATE_FILE = "open_buckets.json"
+
+rollup_headers = [
+    "Bucket_Start",
+    "Granularity",
+    "Topic",
+    "Count",
+    "Value_Mean",
+    "Value_Min",
+    "Value_Max",
+    "Latency_Mean_ms",
+    "Latency_p50_ms",
+    "Latency_p90_ms",
+    "Latency_p99_ms",
+    "Latency_Max_ms",
+    "Packet_Loss_Percent",
+    "Duplicate_Count",
+] + [f"Issue_{issue_type}_Count" for issue_type in range(ISSUE_TYPES)]
+
+
+def latency_bin(latency):
+    if latency <= LATENCY_BASE:
+        return 0
+    k = math.ceil(math.log(latency / LATENCY_BASE, LATENCY_GROWTH))
+    return min(k, LATENCY_BINS - 1)
+
+
+class Bucket:
+    """Aggregates of one topic over one rollup period
+
+    ``count`` and the value statistics include readings the publisher held
+    back with its deadband; latency, loss and issues are per message.
+    """
+
+    __slots__ = (
+        "start",
+        "count",
+        "messages",
+        "value_sum",
+        "value_min",
+        "value_max",
+        "latency_sum",
+        "latency_max",
+        "latency_bins",
+        "loss_sum",
+        "duplicates",
+        "issues",
+    )
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.messages = 0
+        self.value_sum = 0.0
+        self.value_min = math.inf
+        self.value_max = -math.inf
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_bins = [0] * LATENCY_BINS
+        self.loss_sum = 0.0
+        self.duplicates = 0
+        self.issues = [0] * ISSUE_TYPES
+
+    @classmethod
+    def from_state(cls, state):
+        bucket = cls(state["start"])
+        for name in cls.__slots__:
+            setattr(bucket, name, state[name])
+        return bucket
+
+    def state(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def add(self, value, latency, packet_loss, issue_type, held=0):
+        """Fold in one message standing for itself and ``held`` suppressed readings"""
+        self.count += held + 1
+        self.messages += 1
+        self.value_sum += value * (held + 1)
+        self.value_min = min(self.value_min, value)
+        self.value_max = max(self.value_max, value)
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_bins[latency_bin(latency)] += 1
+        self.loss_sum += packet_loss
+        if 0 <= issue_type < ISSUE_TYPES:
+            self.issues[issue_type] += 1
+
+    def latency_quantile(self, q):
+        """Upper edge of the histogram bin holding the q-quantile"""
+        rank = q * self.messages
+        seen = 0
+        for k, n in enumerate(self.latency_bins):
+            seen += n
+            if seen >= rank and n:
+                return min(LATENCY_BASE * LATENCY_GROWTH ** k, self.latency_max)
+        return self.latency_max
+
+    def row(self, granularity, topic):
+        count = self.count or 1
+        messages = self.messages or 1
+        return [
+            self.start,
+            granularity,
+            topic,
+            self.count,
+            self.value_sum / count,
+            self.value_min if self.count else "",
+            self.value_max if self.count else "",
+            self.latency_sum / messages,
+            self.latency_quantile(0.5),
+            self.latency_quantile(0.9),
+            self.latency_quantile(0.99),
+            self.latency_max,
+            self.loss_sum / messages,
+            self.duplicates,
+        ] + self.issues
+
+
+def expire_files(pattern, retention_days, now=None):
+    """Delete files matching pattern that were last written before the retention period"""
+    if not retention_days:
+        return
+    if now is None:
+        now = time.time()
+
+    cutoff = now - retention_days * 86400
+    for path in glob.glob(pattern):
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            print(f"Expired {path}")
+
+
+class RollupStore:
+    """Incrementally maintained per-topic 1 minute, 1 hour and 1 day rollups"""
+
+    def __init__(self, directory, retention=None, sweep_interval=60):
+        self.directory = directory
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.sweep_interval = sweep_interval
+        self.buckets = {granularity: {} for granularity in GRANULARITIES}
+        self.last_sweep = 0
+        for granularity in GRANULARITIES:
+            os.makedirs(os.path.join(directory, granularity), exist_ok=True)
+        self._load_state()
+
+    def _load_state(self):
+        """Resume the buckets left open by the last close()"""
+        path = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as f:
+            state = json.load(f)
+        for granularity, buckets in state.items():
+            if granularity in self.buckets:
+                self.buckets[granularity] = {
+                    topic: Bucket.from_state(bucket) for topic, bucket in buckets.items()}
+        # Removed once loaded, so a crash can't resume the same buckets twice
+        os.remove(path)
+
+    def _partition(self, granularity, start):
+        date_format = GRANULARITIES[granularity][1]
+        name = datetime.datetime.fromtimestamp(start).strftime(date_format)
+        return os.path.join(self.directory, granularity, f"{name}.csv")
+
+    def _write(self, granularity, rows):
+        # Group rows by partition; rows are (start, row)
+        partitions = {}
+        for start, row in rows:
+            partitions.setdefault(self._partition(granularity, start), []).append(row)
+
+        for path, partition_rows in partitions.items():
+            new_file = not os.path.exists(path)
+            with open(path, "a", newline="") as file:
+                writer = csv.writer(file)
+                if new_file:
+                    writer.writerow(rollup_headers)
+                writer.writerows(partition_rows)
+
+    def _bucket(self, granularity, topic, timestamp):
+        seconds = GRANULARITIES[granularity][0]
+        start = int(timestamp // seconds * seconds)
+        buckets = self.buckets[granularity]
+        bucket = buckets.get(topic)
+        if bucket is None or bucket.start != start:
+            if bucket is not None:
+                self._write(granularity, [(bucket.start, bucket.row(granularity, topic))])
+            bucket = buckets[topic] = Bucket(start)
+        return bucket
+
+    def add(self, topic, timestamp, value, latency, packet_loss, issue_type, held=0):
+        """Fold one message, and the readings it held back, into every granularity"""
+        for granularity in GRANULARITIES:
+            self._bucket(granularity, topic, timestamp).add(
+                value, latency, packet_loss, issue_type, held)
+
+        if timestamp - self.last_sweep >= self.sweep_interval:
+            self.sweep(timestamp)
+
+    def add_duplicate(self, topic, timestamp):
+        """Count a suppressed redelivery"""
+        for granularity in GRANULARITIES:
+            self._bucket(granularity, topic, timestamp).duplicates += 1
+
+    def sweep(self, now=None):
+        """Persist buckets whose period has ended and expire old partitions"""
+        if now is None:
+            now = time.time()
+        self.last_sweep = now
+
+        for granularity, (seconds, _) in GRANULARITIES.items():
+            buckets = self.buckets[granularity]
+            closed = [topic for topic, bucket in buckets.items()
+                      if bucket.start + seconds <= now]
+            self._write(granularity, [
+                (buckets[topic].start, buckets.pop(topic).row(granularity, topic))
+                for topic in closed
+            ])
+            expire_files(os.path.join(self.directory, granularity, "*.csv"),
+                         self.retention[granularity], now)
+
+    def close(self):
+        """Write closed buckets and save the open ones to resume on the next start"""
+        self.sweep()
+        state = {
+            granularity: {topic: bucket.state() for topic, bucket in buckets.items()}
+            for granularity, buckets in self.buckets.items()
+        }
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+        for buckets in self.buckets.values():
+            buckets.clear()
@@ -0,0 +1,271 @@
+import csv
+import datetime
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+from columnar import HEADER_FILE, SegmentWriter, read_header
+from rollups import expire_files
+
+
+class CsvStorage:
+    """Raw rows in a CSV file, or one file per day when a retention is set"""
+
+    def __init__(self, path, headers, column_types=None, retention_days=None,
+                 truncate=False):
+        self.path = path
+        self.headers = headers
+        self.retention_days = retention_days
+        self.current_path = None
+        self.file = None
+        self.writer = None
+        self._open(time.time(), truncate)
+
+    def partition_path(self, timestamp):
+        if not self.retention_days:
+            return self.path
+        base, ext = os.path.splitext(self.path)
+        return f"{base}-{datetime.date.fromtimestamp(timestamp).isoformat()}{ext}"
+
+    def _open(self, timestamp, truncate=False):
+        """Switch to the file for timestamp, expiring old daily files"""
+        if self.file:
+            self.file.close()
+
+        path = self.current_path = self.partition_path(timestamp)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if not truncate and os.path.exists(path) and os.path.getsize(path):
+            self._rotate_if_changed(path, timestamp)
+        if not truncate and os.path.exists(path) and os.path.getsize(path):
+            print(f"Appending to dataset file: {path}")
+            self.file = open(path, "a", newline="")
+            self.writer = csv.writer(self.file)
+        else:
+            self.file = open(path, "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(self.headers)
+            print(f"Created dataset file: {path}")
+
+        if self.retention_days:
+            base, ext = os.path.splitext(self.path)
+            expire_files(f"{base}-*{ext}", self.retention_days, timestamp)
+
+    def _rotate_if_changed(self, path, timestamp):
+        """Move a file written with other columns aside instead of appending to it"""
+        with open(path, "r", newline="") as f:
+            existing = next(csv.reader(f), None)
+        if existing != list(self.headers):
+            base, ext = os.path.splitext(path)
+            rotated = f"{base}.{int(timestamp)}{ext}"
+            os.replace(path, rotated)
+            print(f"Dataset columns changed, moved {path} to {rotated}")
+
+    def write(self, row, timestamp):
+        if self.partition_path(timestamp) != self.current_path:
+            self._open(timestamp)
+        self.writer.writerow(row)
+        self.file.flush()
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteStorage:
+    """Raw rows in an SQLite table with typed columns, written in batches
+
+    WAL mode lets analysts query the database while rows are being
+    inserted. Rows are buffered and inserted in one transaction once
+    ``batch_size`` rows are pending or ``flush_interval`` seconds passed.
+    Rows that fail to insert are retried, but at most ``max_pending`` are
+    kept; older ones are dropped and counted in ``dropped``.
+    """
+
+    def __init__(self, path, headers, column_types=None, retention_days=None,
+                 truncate=False, batch_size=500, flush_interval=1.0, table="messages",
+                 max_pending=10000):
+        self.path = path
+        self.headers = headers
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.table = table
+        self.max_pending = max_pending
+        self.pending = []
+        self.dropped = 0
+        self.failing = False
+        self.last_flush = time.time()
+        self.last_expiry = 0
+        self.lock = threading.Lock()
+        column_types = column_types or {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if truncate:
+            self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+        else:
+            self._rotate_if_changed()
+
+        columns = ", ".join(
+            f'"{name}" {column_types.get(name, "TEXT")}' for name in headers)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns})")
+        self.conn.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_time ON {table} ("Timestamp")')
+        self.conn.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_topic ON {table} ("Topic", "Timestamp")')
+        self.conn.commit()
+
+        # Same SQL text every time, so sqlite3 reuses the prepared statement
+        placeholders = ", ".join("?" for _ in headers)
+        self.insert_sql = f"INSERT INTO {table} VALUES ({placeholders})"
+        print(f"Writing dataset to SQLite database: {path}")
+
+    def _rotate_if_changed(self):
+        """Rename a table created with other columns instead of inserting into it"""
+        existing = [row[1] for row in self.conn.execute(f"PRAGMA table_info({self.table})")]
+        if existing and existing != list(self.headers):
+            rotated = f"{self.table}_{int(time.time())}"
+            with self.conn:
+                self.conn.execute(f"ALTER TABLE {self.table} RENAME TO {rotated}")
+                # Index names are per database, free them for the new table
+                self.conn.execute(f"DROP INDEX IF EXISTS {self.table}_time")
+                self.conn.execute(f"DROP INDEX IF EXISTS {self.table}_topic")
+            print(f"Dataset columns changed, renamed table {self.table} to {rotated}")
+
+    def write(self, row, timestamp):
+        with self.lock:
+            self.pending.append(row)
+            # After a failed insert, only retry once per flush interval
+            if ((len(self.pending) >= self.batch_size and not self.failing)
+                    or timestamp - self.last_flush >= self.flush_interval):
+                self._flush(timestamp)
+
+    def flush(self):
+        """Insert pending rows; also called periodically so idle periods don't hold rows back"""
+        with self.lock:
+            self._flush(time.time())
+
+    def _flush(self, now):
+        self.last_flush = now
+        if self.pending:
+            try:
+                with self.conn:
+                    self.conn.executemany(self.insert_sql, self.pending)
+                self.pending.clear()
+                self.failing = False
+            except sqlite3.Error as e:
+                self.failing = True
+                print(f"Error inserting {len(self.pending)} rows: {e}")
+                excess = len(self.pending) - self.max_pending
+                if excess > 0:
+                    del self.pending[:excess]
+                    self.dropped += excess
+                    print(f"Dropped {excess} rows, {self.dropped} in total")
+
+        # Expire raw rows at most once an hour
+        if self.retention_days and now - self.last_expiry >= 3600:
+            self.last_expiry = now
+            cutoff = now - self.retention_days * 86400
+            with self.conn:
+                self.conn.execute(
+                    f'DELETE FROM {self.table} WHERE "Timestamp" < ?', (cutoff,))
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class ColumnarStorage:
+    """Raw rows in an append-only columnar segment (see columnar.py)
+
+    With a retention the path is a directory holding one segment per day,
+    and segments older than the retention are deleted.
+    """
+
+    def __init__(self, path, headers, column_types=None, retention_days=None,
+                 truncate=False, batch_size=500, flush_interval=1.0):
+        self.path = path
+        self.headers = headers
+        self.column_types = column_types
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+        self.lock = threading.Lock()
+        if truncate and os.path.exists(path):
+            shutil.rmtree(path)
+        self.current_path = None
+        self.segment = None
+        self._open(time.time())
+
+    def partition_path(self, timestamp):
+        if not self.retention_days:
+            return self.path
+        return os.path.join(self.path, datetime.date.fromtimestamp(timestamp).isoformat())
+
+    def _open(self, timestamp):
+        if self.segment:
+            self.segment.close()
+        self.current_path = self.partition_path(timestamp)
+        self._rotate_if_changed(self.current_path, timestamp)
+        self.segment = SegmentWriter(self.current_path, self.headers, self.column_types)
+        print(f"Writing dataset to columnar segment: {self.current_path}")
+
+        if self.retention_days:
+            cutoff = timestamp - self.retention_days * 86400
+            for name in os.listdir(self.path):
+                header = os.path.join(self.path, name, HEADER_FILE)
+                if os.path.exists(header) and os.path.getmtime(header) < cutoff:
+                    shutil.rmtree(os.path.join(self.path, name))
+                    print(f"Expired {os.path.join(self.path, name)}")
+
+    def _rotate_if_changed(self, path, timestamp):
+        """Move a segment written with other columns aside instead of appending to it"""
+        header = read_header(path)
+        if header and ([column["name"] for column in header["columns"]] != list(self.headers)
+                       or header["byteorder"] != sys.byteorder):
+            path = os.path.normpath(path)
+            rotated = f"{path}.{int(timestamp)}"
+            os.replace(path, rotated)
+            print(f"Dataset columns changed, moved {path} to {rotated}")
+
+    def write(self, row, timestamp):
+        with self.lock:
+            if self.partition_path(timestamp) != self.current_path:
+                self._open(timestamp)
+            self.segment.append(row)
+            if (self.segment.pending_rows >= self.batch_size
+                    or timestamp - self.last_flush >= self.flush_interval):
+                self.last_flush = timestamp
+                self.segment.flush()
+
+    def flush(self):
+        with self.lock:
+            self.last_flush = time.time()
+            self.segment.flush()
+
+    def close(self):
+        with self.lock:
+            self.segment.close()
+
+
+STORAGES = {
+    "csv": CsvStorage,
+    "sqlite": SqliteStorage,
+    "columnar": ColumnarStorage,
+}
+
+
+def open_storage(kind, path, headers, column_types=None, retention_days=None,
+                 truncate=False):
+    """Create the raw dataset storage backend named kind"""
+    if kind not in STORAGES:
+        raise ValueError(f"Unknown storage backend: {kind}")
+    return STORAGES[kind](path, headers, column_types, retention_days, truncate)
@@ -1,34 +1,65 @@
-import csv
+import argparse
 import datetime
 import json
 import os
 import platform
+import signal
 import socket
 import statistics
 import subprocess
+import sys
 import threading
 import time
 
-import paho.mqtt.client as mqtt
 import psutil
 
-# MQTT Configuration
+from anomaly import DETECTORS, IssueClassifier
+from dedupe import DedupeCache, is_unique_message_id
+from device_state import DeviceRegistry
+from live_state import LiveStateWriter
+from rollups import RollupStore
+from storage import STORAGES, open_storage
+from netem_proxy import ImpairmentProxy, load_timeline
+
+# MQTT Configuration (defaults, overridden by the config file and CLI)
 MQTT_BROKER = "172.31.240.1"
 MQTT_PORT = 1883
+MQTT_CLIENT_ID = "capstone_subscriber"
+MQTT_KEEPALIVE = 60
+# Topic filters; topics are sensor/<device>/<sensor>/<reading>
 TOPICS = [
-    "sensor/dht22/temp",
-    "sensor/dht22/humidity",
-    "sensor/bmp280/temp",
-    "sensor/bmp280/pressure",
-    "sensor/mq135/air_quality",
+    "sensor/#",
 ]
 
+# Seconds between network measurements in the monitoring thread
+MONITOR_INTERVAL = 5
+
+# Network impairment timeline (JSON file) for degraded-link experiments;
+# when set, the subscriber runs a proxy on PROXY_PORT in front of the broker
+# for the publishers (it connects to the broker directly) and tags each row
+# with the active condition
+IMPAIRMENT_TIMELINE = None
+PROXY_PORT = 1884
+impairment_proxy = None
+
+# Memory-mapped file with the latest per-topic aggregates for local
+# dashboards (see live_state.py); disabled when None
+LIVE_STATE_PATH = None
+live_state = None
+
+# Per-topic 1m/1h/1d rollups kept alongside the raw rows. With a raw
+# retention the dataset is split into daily files and old days are deleted
+ROLLUP_DIR = "dataset/rollups"
+ROLLUP_RETENTION_DAYS = None  # e.g. {"1m": 14, "1h": 365, "1d": None}
+RAW_RETENTION_DAYS = None
+rollups = None
+
+# Set to stop background threads and the daemon loop
+stop_event = threading.Event()
+
 # Global variables
-message_history = {topic: [] for topic in TOPICS}
-latency_history = {topic: [] for topic in TOPICS}
-message_counters = {topic: 0 for topic in TOPICS}
-message_per_minute = {topic: 0 for topic in TOPICS}
-failed_deliveries = {topic: 0 for topic in TOPICS}
+# Per-device state is created on first message and evicted when idle
+devices = DeviceRegistry(memory_budget=64 * 1024 * 1024, idle_timeout=3600)
 network_stats = {
     "rtt_history": [],
     "packet_loss": 0,
@@ -37,8 +68,25 @@ network_stats = {
     "throughput": 0,
     "link_speed": 1000,
     "buffer_status": 50,
+    # Sampled by the monitoring thread; cpu_percent() blocks for 100 ms
+    "cpu_usage": 0,
+    "memory_usage": 0,
+    "system_load": 0,
 }
 
+# Streaming per-topic issue classifier ("ewma" or "cusum"), created in main()
+DETECTOR = "ewma"
+issue_classifier = None
+
+# Recently seen message IDs, used to drop QoS 1 redeliveries. IDs embed the
+# device, so they are unique across topics
+seen_messages = DedupeCache(memory_budget=16 * 1024 * 1024, window=600)
+
+# Dataset storage: "csv", "sqlite" or "columnar" (written to csv_filename;
+# a segment directory for "columnar")
+STORAGE_BACKEND = "csv"
+storage = None
+
 # CSV File Setup
 csv_filename = "dataset/new_dataset_2.csv"
 csv_headers = [
@@ -63,6 +111,7 @@ csv_headers = [
     "QoS_Success_Rate",
     "Messages_Per_Minute",
     "Failed_Delivery_Count",
+    "Duplicate_Count",
     "CPU_Utilization_Percent",
     "Memory_Usage_Percent",
     "System_Load",
@@ -73,17 +122,127 @@ csv_headers = [
     "Sender_CPU_Freq",
     "Sender_Memory_Percent",
     "Sender_Reset_Cause",
+    "Sender_Publish_Interval_ms",
+    "Sender_Batch_Size",
+    "Sender_Rate_Level",
+    "Report_Reason",
+    "Suppressed_Count",
+    "Moving_Avg_Value",
+    "Value_Min",
+    "Value_Max",
+    "Value_Stddev",
+    "Sample_Count",
     "Communication_Issue_Type",
+    "Issue_Confidence",
     "Topic",
 ]
 
+# Column types for typed storage backends; every other column is REAL
+TEXT_COLUMNS = {
+    "Time_of_Day",
+    "Sensor_ID",
+    "Message_ID",
+    "Received_Payload",
+    "MQTT_Connection_State",
+    "Network_Condition",
+    "Report_Reason",
+    "Topic",
+}
+INTEGER_COLUMNS = {
+    "Message_Size_Bytes",
+    "TCP_Retransmissions",
+    "Interface_Errors",
+    "MQTT_Message_Queue_Size",
+    "QoS_Level",
+    "Messages_Per_Minute",
+    "Failed_Delivery_Count",
+    "Duplicate_Count",
+    "Sender_CPU_Freq",
+    "Sender_Memory_Percent",
+    "Sender_Reset_Cause",
+    "Sender_Publish_Interval_ms",
+    "Sender_Batch_Size",
+    "Sender_Rate_Level",
+    "Suppressed_Count",
+    "Sample_Count",
+    "Communication_Issue_Type",
+}
+csv_column_types = {
+    name: "TEXT" if name in TEXT_COLUMNS else "INTEGER" if name in INTEGER_COLUMNS else "REAL"
+    for name in csv_headers
+}
+
 
-# Create CSV file with headers
-def initialize_csv():
-    with open(csv_filename, "w", newline="") as file:
-        writer = csv.writer(file)
-        writer.writerow(csv_headers)
-    print(f"Created dataset file: {csv_filename}")
+# Config file keys and the module settings they override
+CONFIG_KEYS = {
+    "broker": "MQTT_BROKER",
+    "port": "MQTT_PORT",
+    "client_id": "MQTT_CLIENT_ID",
+    "keepalive": "MQTT_KEEPALIVE",
+    "topics": "TOPICS",
+    "output": "csv_filename",
+    "storage": "STORAGE_BACKEND",
+    "detector": "DETECTOR",
+    "monitor_interval": "MONITOR_INTERVAL",
+    "impairment": "IMPAIRMENT_TIMELINE",
+    "proxy_port": "PROXY_PORT",
+    "live_state": "LIVE_STATE_PATH",
+    "rollup_dir": "ROLLUP_DIR",
+    "rollup_retention_days": "ROLLUP_RETENTION_DAYS",
+    "raw_retention_days": "RAW_RETENTION_DAYS",
+}
+
+
+def load_config(path):
+    """Apply settings from a JSON config file"""
+    with open(path, "r") as f:
+        config = json.load(f)
+
+    for key, value in config.items():
+        if key not in CONFIG_KEYS:
+            raise ValueError(f"Unknown config key: {key}")
+        globals()[CONFIG_KEYS[key]] = value
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MQTT sensor dataset subscriber")
+    parser.add_argument("--config", help="JSON config file")
+    parser.add_argument("--broker", help="MQTT broker address")
+    parser.add_argument("--port", type=int, help="MQTT broker port")
+    parser.add_argument("--topic", dest="topics", action="append",
+                        help="topic filter to subscribe to (repeatable)")
+    parser.add_argument("--output", help="dataset file (CSV or SQLite database)")
+    parser.add_argument("--storage", choices=sorted(STORAGES),
+                        help="dataset storage backend")
+    parser.add_argument("--detector", choices=sorted(DETECTORS),
+                        help="anomaly detector used to classify communication issues")
+    parser.add_argument("--monitor-interval", type=float,
+                        help="seconds between network measurements")
+    parser.add_argument("--impairment",
+                        help="JSON timeline of network conditions to inject via a local proxy")
+    parser.add_argument("--proxy-port", type=int,
+                        help="port of the impairment proxy (point the Picos here)")
+    parser.add_argument("--live-state",
+                        help="memory-mapped file to publish live per-topic statistics to")
+    parser.add_argument("--rollup-dir", help="directory for 1m/1h/1d rollups")
+    parser.add_argument("--raw-retention-days", type=float,
+                        help="keep raw rows in daily files and delete older ones")
+    parser.add_argument("--daemon", action="store_true",
+                        help="run without the interactive menu until SIGTERM/SIGINT")
+    parser.add_argument("--truncate", action="store_true",
+                        help="start a new dataset instead of appending")
+    return parser.parse_args(argv)
+
+
+def apply_args(args):
+    """Apply the config file, then command line overrides"""
+    if args.config:
+        load_config(args.config)
+
+    for key in CONFIG_KEYS:
+        value = getattr(args, key, None)
+        if value is not None:
+            globals()[CONFIG_KEYS[key]] = value
 
 
 # Functions to collect system metrics
@@ -112,8 +271,16 @@ def get_network_interface():
         return "eth0"  # Default fallback
 
 
-NETWORK_INTERFACE = get_network_interface()
-print(f"Using network interface: {NETWORK_INTERFACE}")
+_network_interface = None
+
+
+def network_interface():
+    """Return the main network interface, detecting it on first use"""
+    global _network_interface
+    if _network_interface is None:
+        _network_interface = get_network_interface()
+        print(f"Using network interface: {_network_interface}")
+    return _network_interface
 
 
 def get_cpu_usage():
@@ -139,7 +306,7 @@ def get_interface_stats():
     try:
         if platform.system() == "Windows":
             # On Windows, gather what we can from psutil
-            net_io = psutil.net_io_counters(pernic=True).get(NETWORK_INTERFACE)
+            net_io = psutil.net_io_counters(pernic=True).get(network_interface())
             if net_io:
                 errors = net_io.errin + net_io.errout
                 return errors, 1000  # Assume 1Gbps as default
@@ -148,7 +315,7 @@ def get_interface_stats():
             try:
                 # Get link speed with ethtool
                 cmd = subprocess.run(
-                    ["ethtool", NETWORK_INTERFACE], capture_output=True, text=True
+                    ["ethtool", network_interface()], capture_output=True, text=True
                 )
                 output = cmd.stdout
                 speed = 1000  # Default 1Gbps
@@ -165,7 +332,7 @@ def get_interface_stats():
                 # Get errors with ifconfig/ip
                 if os.path.exists("/sbin/ifconfig"):
                     cmd = subprocess.run(
-                        ["ifconfig", NETWORK_INTERFACE], capture_output=True, text=True
+                        ["ifconfig", network_interface()], capture_output=True, text=True
                     )
                     output = cmd.stdout
                     errors = 0
@@ -184,7 +351,7 @@ def get_interface_stats():
             except:
                 # Fall back to psutil
                 net_io = psutil.net_io_counters(
-                    pernic=True).get(NETWORK_INTERFACE)
+                    pernic=True).get(network_interface())
                 if net_io:
                     errors = net_io.errin + net_io.errout
                     return errors, 1000
@@ -298,13 +465,10 @@ def calculate_rate_of_change(values, window=5):
     return (recent[-1] - recent[0]) / len(recent)
 
 
-def get_network_buffer_status():
+def get_network_buffer_status(cpu_usage, mem_usage):
     """Estimate network buffer status"""
     try:
         # This is an approximation based on system metrics
-        cpu_usage = get_cpu_usage()
-        mem_usage = get_memory_usage()
-
         # Weighted combination of CPU and memory as proxy for buffer stress
         buffer_status = (cpu_usage * 0.7) + (mem_usage * 0.3)
         return min(100, buffer_status)
@@ -312,26 +476,28 @@ def get_network_buffer_status():
         return 50  # Default middle value
 
 
-def determine_issue_type(metrics):
-    """Determine communication issue type from metrics"""
-    # 0: Normal, 1: Latency, 2: Packet Loss, 3: Throughput, 4: Connection, 5: Resource
+def current_network_condition():
+    """Name of the impairment currently applied by the proxy"""
+    if impairment_proxy is None:
+        return "unknown"
+    return impairment_proxy.condition_name
+
 
-    # Default is normal
-    issue_type = 0
+def determine_issue_type(topic_state, metrics):
+    """Determine communication issue type and confidence from metrics"""
+    # 0: Normal, 1: Latency, 2: Packet Loss, 3: Throughput, 4: Connection, 5: Resource
+    # Each topic learns its own baseline, so no fixed thresholds are needed
+    if topic_state.detectors is None:
+        topic_state.detectors = issue_classifier.create_state()
+    return issue_classifier.classify(topic_state.detectors, metrics)
 
-    # Check for issues in priority order
-    if metrics["mqtt_connection_state"] != "Connected":
-        issue_type = 4  # Connection issue
-    elif metrics["packet_loss"] > 5:
-        issue_type = 2  # Packet loss issue
-    elif metrics["latency"] > 500:
-        issue_type = 1  # Latency issue
-    elif metrics["throughput"] < 1000:
-        issue_type = 3  # Throughput issue
-    elif metrics["cpu_usage"] > 90 or metrics["memory_usage"] > 90:
-        issue_type = 5  # Resource constraint
 
-    return issue_type
+def parse_window_stats(field):
+    """Parse an oversampling summary field: min:max:stddev:samples"""
+    if not field:
+        return None
+    low, high, stddev, samples = field.split(":")
+    return float(low), float(high), float(stddev), int(samples)
 
 
 def parse_enhanced_payload(payload):
@@ -352,7 +518,18 @@ def parse_enhanced_payload(payload):
                 "cpu_freq": int(parts[7]),
                 "reset_cause": int(parts[8]),
                 "qos": int(parts[9]),
-                "network_condition": parts[10] if len(parts) > 10 else "unknown",
+                # Rate controller decisions reported by the publisher
+                "publish_interval": int(parts[10]) if len(parts) > 12 else 0,
+                "batch_size": int(parts[11]) if len(parts) > 12 else 1,
+                "rate_level": int(parts[12]) if len(parts) > 12 else 0,
+                # Report-by-exception: why it was sent and how many readings
+                # were held back since the previous report
+                "report_reason": parts[13] if len(parts) > 15 else "a",
+                "suppressed": int(parts[14]) if len(parts) > 15 else 0,
+                "heartbeat_ms": int(parts[15]) if len(parts) > 15 else 0,
+                # On-device oversampling summary (min, max, stddev, samples)
+                "window_stats": parse_window_stats(parts[16]) if len(parts) > 16 else None,
+                "network_condition": "unknown",
             }
         else:
             # Fallback for old format
@@ -366,6 +543,13 @@ def parse_enhanced_payload(payload):
                 "memory_percent": 0,
                 "cpu_freq": 0,
                 "reset_cause": 0,
+                "publish_interval": 0,
+                "batch_size": 1,
+                "rate_level": 0,
+                "report_reason": "a",
+                "suppressed": 0,
+                "heartbeat_ms": 0,
+                "window_stats": None,
                 "network_condition": "unknown",
             }
     except Exception as e:
@@ -381,6 +565,13 @@ def parse_enhanced_payload(payload):
             "memory_percent": 0,
             "cpu_freq": 0,
             "reset_cause": 0,
+            "publish_interval": 0,
+            "batch_size": 1,
+            "rate_level": 0,
+            "report_reason": "a",
+            "suppressed": 0,
+            "heartbeat_ms": 0,
+            "window_stats": None,
             "network_condition": "unknown",
         }
 
@@ -393,7 +584,7 @@ def network_monitoring_thread():
     last_bytes_total = 0
     last_check_time = time.time()
 
-    while True:
+    while not stop_event.is_set():
         try:
             # Measure RTT
             rtt = measure_rtt()
@@ -427,15 +618,26 @@ def network_monitoring_thread():
                 last_bytes_total = current_bytes
                 last_check_time = current_time
 
-            # Get buffer status
-            network_stats["buffer_status"] = get_network_buffer_status()
+            # Get system metrics and buffer status
+            network_stats["cpu_usage"] = get_cpu_usage()
+            network_stats["memory_usage"] = get_memory_usage()
+            network_stats["system_load"] = get_system_load()
+            network_stats["buffer_status"] = get_network_buffer_status(
+                network_stats["cpu_usage"], network_stats["memory_usage"])
+
+            if live_state:
+                live_state.update_network(network_stats)
+
+            # Insert rows still buffered by batching storage backends
+            if storage:
+                storage.flush()
 
             # Sleep before next check
-            time.sleep(5)
+            stop_event.wait(MONITOR_INTERVAL)
 
         except Exception as e:
             print(f"Error in monitoring thread: {e}")
-            time.sleep(5)
+            stop_event.wait(MONITOR_INTERVAL)
 
 
 # MQTT callbacks
@@ -444,9 +646,10 @@ def on_connect(client, userdata, flags, rc):
     connection_state = "Connected" if rc == 0 else f"Failed (code: {rc})"
     print(f"MQTT connection: {connection_state}")
 
-    # Subscribe to all topics
+    # Subscribe to all topics with QoS 1 so the broker queues messages
+    # for this persistent session while the subscriber restarts
     for topic in TOPICS:
-        client.subscribe(topic)
+        client.subscribe(topic, qos=1)
         print(f"Subscribed to {topic}")
 
 
@@ -464,44 +667,60 @@ def on_message(client, userdata, msg):
         # Decode and parse payload
         payload = msg.payload.decode()
         message_data = parse_enhanced_payload(payload)
+        message_data["network_condition"] = current_network_condition()
+
+        # Look up (or create) the state of the sending device and topic
+        device, topic_state = devices.get(msg.topic, receive_time)
+
+        # Count redelivered messages instead of storing them again
+        message_id = message_data["message_id"]
+        if is_unique_message_id(message_id) and seen_messages.seen(message_id, receive_time):
+            topic_state.duplicates += 1
+            if rollups:
+                rollups.add_duplicate(msg.topic, receive_time)
+            return
 
-        # Update message counter for this topic
-        message_counters[msg.topic] = message_counters.get(msg.topic, 0) + 1
+        # Update message counters for this topic and device
+        topic_state.message_count += 1
+        device.track_sequence(message_id)
 
         # Calculate latency
         latency = (receive_time - message_data["timestamp"]) * 1000  # ms
 
         # Add to latency history for this topic
-        if msg.topic in latency_history:
-            latency_history[msg.topic].append(latency)
-            if len(latency_history[msg.topic]) > 20:
-                latency_history[msg.topic].pop(0)
+        topic_state.latency_history.append(latency)
+        latency_history = list(topic_state.latency_history)
 
         # Calculate jitter
-        jitter = calculate_jitter(latency_history[msg.topic])
+        jitter = calculate_jitter(latency_history)
 
-        # Get system metrics
-        cpu_usage = get_cpu_usage()
-        memory_usage = get_memory_usage()
-        system_load = get_system_load()
+        # Readings suppressed by the publisher's deadband held the previous
+        # value; fill them in so value features see the full series. They
+        # use no sequence numbers, so they are not counted as lost.
+        topic_state.add_value(message_data["value"], message_data["suppressed"])
+        moving_avg_value = calculate_moving_average(list(topic_state.value_history))
+
+        # Get system metrics, as last sampled by the monitoring thread
+        cpu_usage = network_stats["cpu_usage"]
+        memory_usage = network_stats["memory_usage"]
+        system_load = network_stats["system_load"]
 
         # Get network metrics
         rtt = calculate_moving_average(network_stats["rtt_history"])
 
         # Gather derived metrics
-        moving_avg_latency = calculate_moving_average(
-            latency_history[msg.topic])
-        rate_of_change = calculate_rate_of_change(latency_history[msg.topic])
+        moving_avg_latency = calculate_moving_average(latency_history)
+        rate_of_change = calculate_rate_of_change(latency_history)
 
         # Messages per minute
         current_minute = int(time.time() / 60)
-        message_per_minute[msg.topic] = message_counters[msg.topic]
+        topic_state.messages_per_minute = topic_state.message_count
 
         # Process QoS information
         qos_level = msg.qos
 
-        # Calculate packet loss (placeholder - would need sequence numbers to be accurate)
-        packet_loss = 0  # Placeholder
+        # Packet loss from gaps in the device's message sequence numbers
+        packet_loss = device.packet_loss
 
         # Calculate QoS success rate (placeholder)
         qos_success_rate = 100 - packet_loss
@@ -517,7 +736,7 @@ def on_message(client, userdata, msg):
         }
 
         # Determine communication issue type
-        issue_type = determine_issue_type(metrics)
+        issue_type, issue_confidence = determine_issue_type(topic_state, metrics)
 
         # Prepare log data
         log_data = [
@@ -540,8 +759,9 @@ def on_message(client, userdata, msg):
             0,  # Message queue size (placeholder)
             qos_level,
             qos_success_rate,
-            message_per_minute[msg.topic],
-            failed_deliveries.get(msg.topic, 0),
+            topic_state.messages_per_minute,
+            topic_state.failed_deliveries,
+            topic_state.duplicates,
             cpu_usage,
             memory_usage,
             system_load,
@@ -552,14 +772,40 @@ def on_message(client, userdata, msg):
             message_data["cpu_freq"],
             message_data["memory_percent"],
             message_data["reset_cause"],
+            message_data["publish_interval"],
+            message_data["batch_size"],
+            message_data["rate_level"],
+            message_data["report_reason"],
+            message_data["suppressed"],
+            moving_avg_value,
+            *(message_data["window_stats"] or (None, None, None, 1)),
             issue_type,
+            issue_confidence,
             msg.topic,
         ]
 
-        # Save to CSV
-        with open(csv_filename, "a", newline="") as file:
-            writer = csv.writer(file)
-            writer.writerow(log_data)
+        # Publish live aggregates for dashboards
+        if live_state:
+            live_state.update_topic(
+                msg.topic,
+                message_data["value"],
+                latency_history,
+                jitter,
+                issue_type,
+                issue_confidence,
+                topic_state.message_count,
+                topic_state.duplicates,
+                packet_loss,
+                receive_time,
+            )
+
+        # Update the time rollups
+        if rollups:
+            rollups.add(msg.topic, receive_time, message_data["value"], latency,
+                        packet_loss, issue_type, message_data["suppressed"])
+
+        # Save to the dataset
+        storage.write(log_data, receive_time)
 
         # Print short status
         print(
@@ -607,7 +853,7 @@ def simulate_network_conditions():
             print(f"\nApplying condition: {condition['name']}")
 
             # Replace IFACE with actual interface
-            cmd = condition["cmd"].replace("IFACE", NETWORK_INTERFACE)
+            cmd = condition["cmd"].replace("IFACE", network_interface())
 
             # Ask for confirmation before applying
             response = input(f"Run command: '{cmd}'? (y/n): ")
@@ -635,36 +881,149 @@ def simulate_network_conditions():
         print("\nExiting network condition simulator")
         # Try to restore normal conditions
         try:
-            reset_cmd = f"sudo tc qdisc del dev {NETWORK_INTERFACE} root"
+            reset_cmd = f"sudo tc qdisc del dev {network_interface()} root"
             os.system(reset_cmd)
             print("Network conditions reset to normal")
         except:
             pass
 
 
-def main():
-    # Initialize CSV file
-    initialize_csv()
+def create_client():
+    """Create the MQTT client with a persistent session"""
+    # Imported here so importing this module stays fast and side-effect free
+    import paho.mqtt.client as mqtt
 
-    # Create MQTT client
-    client = mqtt.Client()
+    client = mqtt.Client(
+        mqtt.CallbackAPIVersion.VERSION1,
+        client_id=MQTT_CLIENT_ID,
+        clean_session=False,
+    )
     client.on_connect = on_connect
     client.on_message = on_message
     client.on_disconnect = on_disconnect
+    return client
 
-    # Start network monitoring in background thread
-    monitor_thread = threading.Thread(target=network_monitoring_thread)
-    monitor_thread.daemon = True
-    monitor_thread.start()
 
+def show_network_statistics():
+    print("\nCurrent Network Statistics:")
+    print(f"RTT: {calculate_moving_average(network_stats['rtt_history']):.2f} ms")
+    print(f"Throughput: {network_stats['throughput']:.2f} bytes/sec")
+    print(f"Retransmissions: {network_stats['retransmissions']}")
+    print(f"Interface Errors: {network_stats['interface_errors']}")
+    print(f"Link Speed: {network_stats['link_speed']} Mbps")
+    print(f"CPU Usage: {network_stats['cpu_usage']:.1f}%")
+    print(f"Memory Usage: {network_stats['memory_usage']:.1f}%")
+
+
+def run_menu():
+    """Interactive menu for controlling the application"""
     # Create condition simulation menu thread
     sim_thread = threading.Thread(target=simulate_network_conditions)
     sim_thread.daemon = True
 
+    while True:
+        print("\nOptions:")
+        print("1. Show current network statistics")
+        print("2. Start network condition simulator")
+        print("3. Reset network conditions")
+        print("4. Exit")
+
+        choice = input("Select an option: ")
+
+        if choice == "1":
+            # Show current network stats
+            show_network_statistics()
+
+        elif choice == "2":
+            # Start network condition simulator
+            if not sim_thread.is_alive():
+                sim_thread = threading.Thread(
+                    target=simulate_network_conditions)
+                sim_thread.daemon = True
+                sim_thread.start()
+            else:
+                print("Simulator is already running")
+
+        elif choice == "3":
+            # Reset network conditions
+            try:
+                if platform.system() == "Linux":
+                    reset_cmd = f"sudo tc qdisc del dev {network_interface()} root"
+                    os.system(reset_cmd)
+                    print("Network conditions reset to normal")
+                else:
+                    print("This feature is only available on Linux")
+            except Exception as e:
+                print(f"Error resetting network conditions: {e}")
+
+        elif choice == "4":
+            # Exit the program
+            break
+
+        else:
+            print("Invalid choice. Please select a valid option.")
+
+
+def run_daemon():
+    """Run without a menu until SIGTERM or SIGINT is received"""
+    def request_stop(signum, frame):
+        print(f"\nReceived signal {signum}, draining...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    # Wake up periodically so signals are handled promptly on every platform
+    while not stop_event.wait(1):
+        pass
+
+
+def start_impairment_proxy():
+    """Start the impairment proxy in front of the broker for the publishers"""
+    global impairment_proxy
+    impairment_proxy = ImpairmentProxy(
+        MQTT_BROKER, MQTT_PORT, load_timeline(IMPAIRMENT_TIMELINE),
+        listen_port=PROXY_PORT,
+    )
+    impairment_proxy.start()
+
+
+def main(argv=None):
+    """Run the subscriber; returns the process exit status"""
+    args = parse_args(argv)
+    apply_args(args)
+
+    # Impair the publishers' link only: the subscriber connects to the broker
+    # directly, so each row's Network_Condition is exactly what was injected
+    if IMPAIRMENT_TIMELINE:
+        start_impairment_proxy()
+
+    global issue_classifier, storage, live_state, rollups
+    issue_classifier = IssueClassifier(DETECTOR)
+
+    # Open the dataset storage
+    storage = open_storage(STORAGE_BACKEND, csv_filename, csv_headers,
+                           csv_column_types, RAW_RETENTION_DAYS, args.truncate)
+
+    if ROLLUP_DIR:
+        rollups = RollupStore(ROLLUP_DIR, ROLLUP_RETENTION_DAYS)
+    if LIVE_STATE_PATH:
+        live_state = LiveStateWriter(LIVE_STATE_PATH)
+        print("Publishing live statistics to:", LIVE_STATE_PATH)
+
+    # Create MQTT client
+    client = create_client()
+
+    # Start network monitoring in background thread
+    monitor_thread = threading.Thread(target=network_monitoring_thread)
+    monitor_thread.daemon = True
+    monitor_thread.start()
+
+    status = 0
     try:
         # Connect to MQTT broker
         print(f"Connecting to MQTT broker at {MQTT_BROKER}:{MQTT_PORT}...")
-        client.connect(MQTT_BROKER, MQTT_PORT, 60)
+        client.connect(MQTT_BROKER, MQTT_PORT, MQTT_KEEPALIVE)
 
         # Start MQTT loop in a background thread
         client.loop_start()
@@ -672,74 +1031,36 @@ def main():
         print("MQTT Subscriber started. Press Ctrl+C to exit.")
         print("Recording data to:", csv_filename)
 
-        # Menu for controlling the application
-        while True:
-            print("\nOptions:")
-            print("1. Show current network statistics")
-            print("2. Start network condition simulator")
-            print("3. Reset network conditions")
-            print("4. Exit")
-
-            choice = input("Select an option: ")
-
-            if choice == "1":
-                # Show current network stats
-                print("\nCurrent Network Statistics:")
-                print(
-                    f"RTT: {calculate_moving_average(
-                        network_stats['rtt_history']):.2f} ms"
-                )
-                print(f"Throughput: {
-                      network_stats['throughput']:.2f} bytes/sec")
-                print(f"Retransmissions: {network_stats['retransmissions']}")
-                print(f"Interface Errors: {network_stats['interface_errors']}")
-                print(f"Link Speed: {network_stats['link_speed']} Mbps")
-                print(f"CPU Usage: {get_cpu_usage():.1f}%")
-                print(f"Memory Usage: {get_memory_usage():.1f}%")
-
-            elif choice == "2":
-                # Start network condition simulator
-                if not sim_thread.is_alive():
-                    sim_thread = threading.Thread(
-                        target=simulate_network_conditions)
-                    sim_thread.daemon = True
-                    sim_thread.start()
-                else:
-                    print("Simulator is already running")
-
-            elif choice == "3":
-                # Reset network conditions
-                try:
-                    if platform.system() == "Linux":
-                        reset_cmd = f"sudo tc qdisc del dev {
-                            NETWORK_INTERFACE} root"
-                        os.system(reset_cmd)
-                        print("Network conditions reset to normal")
-                    else:
-                        print("This feature is only available on Linux")
-                except Exception as e:
-                    print(f"Error resetting network conditions: {e}")
-
-            elif choice == "4":
-                # Exit the program
-                break
-
-            else:
-                print("Invalid choice. Please select a valid option.")
+        if args.daemon:
+            run_daemon()
+        else:
+            run_menu()
 
     except KeyboardInterrupt:
         print("\nInterrupted by user")
     except Exception as e:
         print(f"Error in main loop: {e}")
+        # Let a service manager see the failure and restart the daemon
+        status = 1
     finally:
-        # Clean up and exit
+        # Stop receiving, let in-flight messages finish, then clean up. The
+        # session is kept by the broker, so a restart resumes where we left off
+        stop_event.set()
         try:
-            client.loop_stop()
             client.disconnect()
+            client.loop_stop()
         except:
             pass
+        if impairment_proxy:
+            impairment_proxy.stop()
+        if live_state:
+            live_state.close()
+        if rollups:
+            rollups.close()
+        storage.close()
         print("Subscriber stopped.")
+    return status
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())